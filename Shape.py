@@ -1,9 +1,10 @@
-import copy
 from math import sqrt
-import numpy as np
 from PyQt6 import QtCore, QtGui, QtWidgets
+import numpy as np
 import random
 
+from utils.shape_store import DEFAULT_STORE, CLOSED, FILL, SELECTED, HAS_COLOR, INTEGRAL
+
 DEFAULT_LINE_COLOR = QtGui.QColor(0, 255, 0, 128)  # bf hovering
 DEFAULT_FILL_COLOR = QtGui.QColor(0, 255, 0, 128)  # hovering
 DEFAULT_SELECT_LINE_COLOR = QtGui.QColor(255, 255, 255)  # selected
@@ -22,81 +23,200 @@ class Shape(object):
     # Flag for all other handles
     NEAR_VERTEX = 1
 
-    line_color = DEFAULT_LINE_COLOR
-    fill_color = DEFAULT_FILL_COLOR
     select_line_color = DEFAULT_SELECT_LINE_COLOR
-    select_fill_color = DEFAULT_SELECT_FILL_COLOR
-    vertex_fill_color = DEFAULT_VERTEX_FILL_COLOR
     hvertex_fill_color = DEFAULT_HVERTEX_FILL_COLOR  #highlight
     point_type = P_ROUND
     point_size = 8
     scale = 1.0
+    lod_handle_size = 2 * point_size  # screen size of a box under which paintBatch skips its handles
+    lod_dot_size = 3  # and under which the box is a dot
+
+    _highlightSettings = {
+        MOVE_VERTEX: (1.5, P_SQUARE),
+        NEAR_VERTEX: (4, P_ROUND)
+    }
 
-    def __init__(self, label=None, line_color=None, flags=None, group_id=None):
+    shape_type = "rectangle"
+
+    # a view over one row of a ShapeStore, which holds points, label, colors and state
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, label=None, line_color=None, flags=None, group_id=None, store=None):
+        self._store = DEFAULT_STORE if store is None else store
+        self._row = self._store.allocate()
         self.label = label
         self.group_id = group_id
-        self.points = list()
-        self.fill = False
-        self.selected = False
         self.flags = flags
-        self.other_data = dict()
-
-        self._highlightIndex = None
-        self._highlightMode = self.NEAR_VERTEX
-        self._highlightSettings = {
-            self.MOVE_VERTEX: (1.5, self.P_SQUARE),
-            self.NEAR_VERTEX: (4, self.P_ROUND)
-        }
-
-        self._closed = False
 
         if line_color is not None:
             self.line_color = line_color
 
-        self.shape_type = "rectangle"
+    def __del__(self):
+        try:
+            self._store.release(self._row)
+        except (AttributeError, TypeError):  # interpreter shutdown
+            pass
+
+    @property
+    def points(self):
+        store, row = self._store, self._row
+        n = store.npoints[row]
+        coords = store.coords[row].tolist()
+        point = QtCore.QPoint if store.state[row] & INTEGRAL else QtCore.QPointF
+        if point is QtCore.QPoint:
+            coords = [int(c) for c in coords]
+        return [point(coords[2 * i], coords[2 * i + 1]) for i in range(n)]
+
+    @points.setter
+    def points(self, points):
+        if len(points) > 2:
+            raise ValueError(f"rectangle takes at most 2 points : {len(points)}")
+        store, row = self._store, self._row
+        coords = store.coords[row]
+        coords[:] = 0
+        for i, p in enumerate(points):
+            coords[2 * i] = p.x()
+            coords[2 * i + 1] = p.y()
+        store.npoints[row] = len(points)
+        store.setState(row, INTEGRAL, all(isinstance(p, QtCore.QPoint) for p in points))
+
+    @property
+    def label(self):
+        return self._store.label(self._row)
+
+    @label.setter
+    def label(self, label):
+        self._store.labelIds[self._row] = self._store.labelId(label)
+
+    @property
+    def group_id(self):
+        group_id = self._store.groupIds[self._row]
+        return int(group_id) if group_id >= 0 else None
+
+    @group_id.setter
+    def group_id(self, group_id):
+        self._store.groupIds[self._row] = -1 if group_id is None else group_id
+
+    @property
+    def flags(self):
+        return self._store.flags.get(self._row)
+
+    @flags.setter
+    def flags(self, flags):
+        if flags is None:
+            self._store.flags.pop(self._row, None)
+        else:
+            self._store.flags[self._row] = flags
+
+    @property
+    def other_data(self):
+        return self._store.otherData.setdefault(self._row, dict())
+
+    @property
+    def fill(self):
+        return self._store.hasState(self._row, FILL)
+
+    @fill.setter
+    def fill(self, value):
+        self._store.setState(self._row, FILL, value)
+
+    @property
+    def selected(self):
+        return self._store.hasState(self._row, SELECTED)
+
+    @selected.setter
+    def selected(self, value):
+        self._store.setState(self._row, SELECTED, value)
+
+    @property
+    def _highlightIndex(self):
+        index = self._store.highlight[self._row]
+        return int(index) if index >= 0 else None
+
+    @property
+    def _highlightMode(self):
+        return int(self._store.highlightMode[self._row])
+
+    # colors : one rgb per shape, the alpha of each role is fixed
+    def setColor(self, r, g, b):
+        self._store.colors[self._row] = (r << 16) | (g << 8) | b
+        self._store.setState(self._row, HAS_COLOR, True)
+        self._store.colorRevision += 1
+
+    def _color(self, alpha, default):
+        store, row = self._store, self._row
+        if not store.state[row] & HAS_COLOR:
+            return default
+        rgb = int(store.colors[row])
+        return QtGui.QColor(rgb >> 16, (rgb >> 8) & 0xFF, rgb & 0xFF, alpha)
+
+    @property
+    def line_color(self):
+        return self._color(128, DEFAULT_LINE_COLOR)
+
+    @line_color.setter
+    def line_color(self, color):
+        self.setColor(color.red(), color.green(), color.blue())
+
+    @property
+    def fill_color(self):
+        return self._color(128, DEFAULT_FILL_COLOR)
+
+    @property
+    def select_fill_color(self):
+        return self._color(155, DEFAULT_SELECT_FILL_COLOR)
+
+    @property
+    def vertex_fill_color(self):
+        return self._color(255, DEFAULT_VERTEX_FILL_COLOR)
 
     def close(self):
-        self._closed = True
+        self._store.setState(self._row, CLOSED, True)
 
     def setOpen(self):
-        self._closed = False
+        self._store.setState(self._row, CLOSED, False)
 
     def addPoint(self, point):  # polygon
-        if self.points and point == self.points[0]:
+        points = self.points
+        if points and point == points[0]:
             self.close()
         else:
-            self.points.append(point)
+            self.points = points + [point]
 
     def popPoint(self):
-        if self.points:
-            return self.points.pop()
+        points = self.points
+        if points:
+            point = points.pop()
+            self.points = points
+            return point
         return None
 
     def insertPoint(self, index, point):
-        self.points.insert(index, point)
+        points = self.points
+        points.insert(index, point)
+        self.points = points
 
     def removePoint(self, index):
-        self.points.pop(index)
+        points = self.points
+        points.pop(index)
+        self.points = points
 
     def isClosed(self):
-        return self._closed
+        return self._store.hasState(self._row, CLOSED)
 
     def getRectFromLine(self, pt1, pt2):
         x1, y1 = pt1.x(), pt1.y()
         x2, y2 = pt2.x(), pt2.y()
         return QtCore.QRectF(x1, y1, x2-x1, y2-y1)
 
-    def drawVertex(self, path, index):
+    def drawVertex(self, path, index, point=None):
         d = self.point_size / self.scale
         shape = self.point_type
-        point = self.points[index]
+        if point is None:
+            point = self.points[index]
         if index == self._highlightIndex:  # highligtVertex 함수로 설정. default = None
             size, shape = self._highlightSettings[self._highlightMode]
             d *= size  # NEAR_VERTEX : 4  MOVE_VERTEX : 1.5
-        if self._highlightIndex is not None:
-            self._vertex_fill_color = self.hvertex_fill_color
-        else:
-            self._vertex_fill_color = self.vertex_fill_color
 
         if shape == self.P_SQUARE:
             path.addRect(point.x() - d/2, point.y() - d/2, d, d)
@@ -127,7 +247,8 @@ class Shape(object):
         return post_i
 
     def paint(self, painter):
-        if self.points:
+        points = self.points
+        if points:
             color = self.select_line_color if self.selected else self.line_color
 
             pen = QtGui.QPen(color)
@@ -138,22 +259,124 @@ class Shape(object):
         vrtx_path = QtGui.QPainterPath()
 
         # draw rectangle and vertex
-        assert len(self.points) in [1, 2], f"{len(self.points)}"
-        if len(self.points) == 2:
-            rectangle = self.getRectFromLine(*self.points)  # 언패킹
+        assert len(points) in [1, 2], f"{len(points)}"
+        if len(points) == 2:
+            rectangle = self.getRectFromLine(*points)  # 언패킹
             line_path.addRect(rectangle)  # path에 QRectF 객체 추가
-        for i in range(len(self.points)):
-            self.drawVertex(vrtx_path, i)
+        for i, point in enumerate(points):
+            self.drawVertex(vrtx_path, i, point)
 
         painter.drawPath(line_path)
         painter.drawPath(vrtx_path)
-        painter.fillPath(vrtx_path, self._vertex_fill_color)
+        if self._highlightIndex is not None:
+            painter.fillPath(vrtx_path, self.hvertex_fill_color)
+        else:
+            painter.fillPath(vrtx_path, self.vertex_fill_color)
 
         #  fill rectangle
         if self.fill:  # default = False
             color = self.select_fill_color if self.selected else self.fill_color
             painter.fillPath(line_path, color)
 
+    @staticmethod
+    def paintBatch(painter, shapes, clip=None, plain=False):
+        # paints shapes like paint, grouped by line color : one drawRects and two drawPoints
+        # per group instead of paths per shape. a vertex handle is a point of the line color
+        # under a point of the vertex color, the pen width narrower, like the outlined ellipse.
+        # filled groups go on top, shapes with a highlighted vertex or a single point go
+        # through paint, last. level of detail, in screen pixels : boxes under
+        # lod_handle_size lose their handles, boxes under lod_dot_size are a single dot.
+        # clip : (left, top, right, bottom) in image coordinates, shapes outside are skipped.
+        # plain paints boxes as if none were selected, filled or highlighted
+        scale = Shape.scale
+        groups = dict()  # (selected and fill bits, rgb) -> (shape, rects, vertices, dots)
+        single = list()
+        for shape in shapes:
+            store, row = shape._store, shape._row
+            n = store.npoints[row]
+            if not n:
+                continue
+            x1, y1, x2, y2 = store.coords[row].tolist()
+            if n == 1:
+                x2, y2 = x1, y1
+            if clip is not None and (max(x1, x2) < clip[0] or min(x1, x2) > clip[2] or
+                                     max(y1, y2) < clip[1] or min(y1, y2) > clip[3]):
+                continue
+            state = int(store.state[row])
+            if (store.highlight[row] >= 0 and not plain) or n != 2:
+                single.append(shape)
+                continue
+            key = (0 if plain else state & (SELECTED | FILL), int(store.colors[row]) if state & HAS_COLOR else -1)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = (shape, list(), list(), list())
+            size = max(abs(x2 - x1), abs(y2 - y1)) * scale
+            if size < Shape.lod_dot_size:
+                group[3].append(QtCore.QPointF((x1 + x2) / 2, (y1 + y2) / 2))
+                continue
+            group[1].append(QtCore.QRectF(x1, y1, x2-x1, y2-y1))
+            if size >= Shape.lod_handle_size:
+                group[2].extend((QtCore.QPointF(x1, y1), QtCore.QPointF(x2, y2)))
+
+        width = max(1, int(round(2.0/scale)))
+        d = Shape.point_size / scale
+        cap = QtCore.Qt.PenCapStyle.RoundCap if Shape.point_type == Shape.P_ROUND else QtCore.Qt.PenCapStyle.SquareCap
+        for key in sorted(groups, key=lambda key: key[0] & FILL):
+            shape, rects, vertices, dots = groups[key]
+            pen = QtGui.QPen(shape.select_line_color if key[0] & SELECTED else shape.line_color)
+            pen.setWidth(width)
+            painter.setPen(pen)
+            painter.setBrush(QtCore.Qt.BrushStyle.NoBrush)
+            if rects:
+                painter.drawRects(rects)
+            if dots:
+                # a dot covers what the outline of a box that small would
+                pen.setWidthF(Shape.lod_dot_size / scale + width)
+                painter.setPen(pen)
+                painter.drawPoints(QtGui.QPolygonF(dots))
+
+            if vertices:
+                vertices = QtGui.QPolygonF(vertices)
+                pen.setCapStyle(cap)
+                pen.setWidthF(d + width)
+                painter.setPen(pen)
+                painter.drawPoints(vertices)
+                pen.setColor(shape.vertex_fill_color)
+                pen.setWidthF(d)
+                painter.setPen(pen)
+                painter.drawPoints(vertices)
+
+            if key[0] & FILL and rects:
+                painter.setPen(QtCore.Qt.PenStyle.NoPen)
+                painter.setBrush(shape.select_fill_color if key[0] & SELECTED else shape.fill_color)
+                painter.drawRects(rects)
+        painter.setBrush(QtCore.Qt.BrushStyle.NoBrush)
+
+        for shape in single:
+            shape.paint(painter)
+
+    @staticmethod
+    def boxes(shapes):
+        # (N, 4) x1, y1, x2, y2 of shapes read from their store rows at once. a single point
+        # is a box collapsed on that point, a shape without points a NaN row
+        shapes = list(shapes)
+        boxes = np.full((len(shapes), 4), np.nan)
+        if not shapes:
+            return boxes
+        store = shapes[0]._store
+        if all(shape._store is store for shape in shapes):
+            rows = np.fromiter((shape._row for shape in shapes), dtype=np.intp, count=len(shapes))
+            coords, npoints = store.coords[rows], store.npoints[rows]
+            boxes[npoints >= 2] = coords[npoints >= 2]
+            boxes[npoints == 1] = coords[npoints == 1][:, [0, 1, 0, 1]]
+            return boxes
+        for i, shape in enumerate(shapes):
+            points = shape.points
+            if points:
+                p0, p1 = points[0], points[-1]
+                boxes[i] = p0.x(), p0.y(), p1.x(), p1.y()
+        return boxes
+
     #  return bool whether path contains given point
     def containsPoint(self, point):
         return self.makePath().contains(QtCore.QPointF(point))
@@ -161,8 +384,9 @@ class Shape(object):
     # return rectangle path made by points
     def makePath(self):
         path = QtGui.QPainterPath()
-        if len(self.points) == 2:
-            rectangle = self.getRectFromLine(*self.points)
+        points = self.points
+        if len(points) == 2:
+            rectangle = self.getRectFromLine(*points)
             path.addRect(rectangle)
         return path
 
@@ -174,33 +398,38 @@ class Shape(object):
         self.points = [p + offset for p in self.points]
 
     def moveVertexBy(self, index, offset):
-        self.points[index] = self.points[index] + offset
+        self[index] = self[index] + offset
 
     def highlightVertex(self, index, action):
-        self._highlightIndex = index
-        self._highlightMode = action  # MOVE_VERTEX or NEAR_VERTEX
+        self._store.highlight[self._row] = index
+        self._store.highlightMode[self._row] = action  # MOVE_VERTEX or NEAR_VERTEX
 
     def highlightClear(self):
-        self._highlightIndex = None
+        self._store.highlight[self._row] = -1
 
     def copy(self):
-        return copy.deepcopy(self)
+        shape = Shape.__new__(Shape)
+        shape._store = self._store
+        shape._row = self._store.copyRow(self._row)
+        return shape
 
     def distance(self, p):
         return sqrt(p.x() * p.x() + p.y() * p.y())
 
     def distancetoline(self, point, line):
-        p1, p2 = line
-        p1 = np.array([p1.x(), p1.y()])
-        p2 = np.array([p2.x(), p2.y()])
-        p3 = np.array([point.x(), point.y()])
-        if np.dot((p3-p1), (p2-p1)) < 0:
-            return np.linalg.norm(p3-p1)
-        if np.dot((p3-p2), (p1-p2)) < 0:
-            return np.linalg.norm(p3-p2)
-        if np.linalg.norm(p2-p1) == 0:
+        # plain floats, numpy's per call overhead outweighs two dimensional math
+        x1, y1 = line[0].x(), line[0].y()
+        x2, y2 = line[1].x(), line[1].y()
+        x3, y3 = point.x(), point.y()
+        dx, dy = x2 - x1, y2 - y1
+        if (x3 - x1) * dx + (y3 - y1) * dy < 0:
+            return sqrt((x3 - x1) * (x3 - x1) + (y3 - y1) * (y3 - y1))
+        if (x3 - x2) * -dx + (y3 - y2) * -dy < 0:
+            return sqrt((x3 - x2) * (x3 - x2) + (y3 - y2) * (y3 - y2))
+        length = sqrt(dx * dx + dy * dy)
+        if length == 0:
             return 0
-        return np.linalg.norm(np.cross(p2-p1, p1-p3)) / np.linalg.norm(p2-p1)
+        return abs(dx * (y1 - y3) - dy * (x1 - x3)) / length
 
     # def change_shape_color(self):
     #     r, g, b = random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)
@@ -210,10 +439,12 @@ class Shape(object):
     #     self.vertex_fill_color = QtGui.QColor(r, g, b, 128)
 
     def __len__(self):
-        return len(self.points)
+        return int(self._store.npoints[self._row])
 
     def __getitem__(self, item):
         return self.points[item]
 
     def __setitem__(self, key, value):
-        self.points[key] = value
+        points = self.points
+        points[key] = value
+        self.points = points
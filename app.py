@@ -1,18 +1,14 @@
 import os.path as osp
 import sys
 import json
-import numpy as np
 import functools
-import natsort
+import math
+import re
 
 from PyQt6 import QtCore
 from PyQt6 import QtWidgets
 from PyQt6 import QtGui
 
-import io
-import PIL.Image
-import PIL.ImageOps
-import PIL.ExifTags
 from video_crop import VideoSelectDialog, VideoParseDialog
 
 from Shape import Shape
@@ -21,12 +17,23 @@ from widgets.zoom_widget import ZoomWidget
 from widgets.label_dialog import LabelDialog
 from widgets.label_list_widget import LabelListWidgetItem, LabelListWidget
 from widgets.unique_label_list import UniqLabelListWidgetItem, UniqLabelListWidget
+from widgets.file_list_widget import FileListWidget
+from widgets.file_dialog_preview import FileDialogPreview
+from widgets.gallery_widget import GalleryWidget
+from utils.annotation_journal import AnnotationJournal
+from utils.dataset_index import DatasetIndex
+from utils.dir_scanner import DirScanner
+from utils.file_search import FileSearchIndex
+from utils.image_cache import ImageCache, decodePreview
+from utils.image_probe import probeImage
+from utils.label_colors import labelColor
+from utils.label_registry import LabelRegistry
+from utils.thumbnail_cache import ThumbnailCache
+from utils.tile_pyramid import TilePyramid, TILED_IMAGE_PIXELS
 
 
 here = osp.dirname(osp.abspath(__file__))
 
-mode_to_bpp = {'1': 1, 'L': 8, 'P': 8, 'RGB': 24, 'RGBA': 32, 'CMYK': 32, 'YCbCr': 24, 'I': 32, 'F': 32}
-
 
 def newIcon(icon):
     icons_dir = osp.join(here, "icons")
@@ -36,6 +43,8 @@ def newIcon(icon):
 class MainWindow(QtWidgets.QMainWindow):
 
     FIT_WINDOW, FIT_WIDTH, MANUAL_ZOOM = 0, 1, 2
+    PREFETCH_NEXT, PREFETCH_PREV = 3, 1  # file list entries decoded ahead of A/D paging
+    PREVIEW_MAX_SCALE = 0.5  # below this fit-to-window scale a reduced resolution decode is shown first
 
     def __init__(self):
         super().__init__()
@@ -50,15 +59,23 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.filename = None
         self.lastOpenDir = None
+        self.datasetIndex = None
+        self.scanner = None
+        self.searchIndex = FileSearchIndex()
         self.outputDir = None
         self.OUTPUT = 0
         self.SEARCH = 0
         self.DRAW_UNIQUE = 0
         self.UNIQUE_LABEL_DATA = dict()
+        self.labelRegistry = LabelRegistry()  # label -> id, color and use count of the session
 
         self._noSelectionSignal = False  # prevent label change signal recursion
 
         self.setStatusBar(QtWidgets.QStatusBar())
+        self.scanCancel = QtWidgets.QPushButton("Cancel Scan")
+        self.scanCancel.setVisible(False)
+        self.scanCancel.clicked.connect(self.cancelScan)
+        self.statusBar().addPermanentWidget(self.scanCancel)
 
         menu = self.menuBar()
         layout = QtWidgets.QHBoxLayout()
@@ -89,9 +106,14 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setCentralWidget(scrollArea)
 
         self.image = QtGui.QImage()
+        self.imageCache = ImageCache()
+        self.imageCache.imageLoaded.connect(self.imageLoaded)
+        self.thumbnails = ThumbnailCache()  # shared by the open dialog, the gallery and file list tooltips
+        self.journal = AnnotationJournal()  # unsaved edits, replayed after a crash
+        self.canvas.journal = self.journal
+        QtCore.QTimer.singleShot(0, self.recoverJournal)
         self.imageData = None
-        self.imageDepth = None
-        self.color = list()
+        self.imageInfo = None  # width, height, depth, orientation read from the file header
         self.recent_file = list()
         self.defaultSavePath = None
 
@@ -146,6 +168,17 @@ class MainWindow(QtWidgets.QMainWindow):
         self.delete_box = self.action("Delete Box", icon="cancel", shortcut="Del", tip="Delete the selected Box")
         edit_menu.addAction(self.delete_box)
         self.delete_box.triggered.connect(self.deleteSelectedShape)
+        edit_menu.addSeparator()
+        self.undo_edit = self.action("Undo", icon="undo", shortcut="Ctrl+Z", tip="Undo the last Box edit")
+        edit_menu.addAction(self.undo_edit)
+        self.undo_edit.setEnabled(False)
+        self.undo_edit.triggered.connect(self.canvas.restoreShape)
+        self.canvas.undoStack.canUndoChanged.connect(self.undo_edit.setEnabled)
+        self.redo_edit = self.action("Redo", shortcut="Ctrl+Shift+Z", tip="Redo the last undone Box edit")
+        edit_menu.addAction(self.redo_edit)
+        self.redo_edit.setEnabled(False)
+        self.redo_edit.triggered.connect(self.canvas.redoShape)
+        self.canvas.undoStack.canRedoChanged.connect(self.redo_edit.setEnabled)
         # clear = self.action("Clear", icon="edit", shortcut="Ctrl+O", tip="Clear image and box")
         # clear.triggered.connect(self.canvas.resetState)
         # edit_menu.addAction(clear)
@@ -164,9 +197,10 @@ class MainWindow(QtWidgets.QMainWindow):
         # add "Label List"
         self.label_list = QtWidgets.QDockWidget("Label List")
         # self.label_list.setWidget(QtWidgets.QListWidget())
-        self.label_list.setWidget(UniqLabelListWidget())
+        self.label_list.setWidget(UniqLabelListWidget(self.labelRegistry))
         self.label_list.widget().itemClicked.connect(self.drawUniqMode)
         view_menu.addAction(self.label_list.toggleViewAction())
+        self.labelDialog = LabelDialog(self, self.labelRegistry)
 
         # add "Polygon Labels"
         self.polygon_label = QtWidgets.QDockWidget("Polygon Labels")
@@ -185,11 +219,16 @@ class MainWindow(QtWidgets.QMainWindow):
         file_container = QtWidgets.QWidget()
         fileListLayout = QtWidgets.QVBoxLayout()
 
-        self.fileListWidget = QtWidgets.QListWidget()
+        self.fileListWidget = FileListWidget()
+        self.fileListWidget.model().thumbnails = self.thumbnails
         self.fileListWidget.itemSelectionChanged.connect(self.loadItemSelection)
         self.filesearch = QtWidgets.QLineEdit()
         self.filesearch.setPlaceholderText("Search Filename")
         self.filesearch.textChanged.connect(self.searchFile)
+        self.searchTimer = QtCore.QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.setInterval(200)  # debounce : one search per typing burst
+        self.searchTimer.timeout.connect(self.applySearch)
 
         fileListLayout.addWidget(self.filesearch)
         fileListLayout.addWidget(self.fileListWidget)
@@ -197,9 +236,26 @@ class MainWindow(QtWidgets.QMainWindow):
         file_list.setWidget(file_container)
         view_menu.addAction(file_list.toggleViewAction())
 
+        # add "Gallery"
+        gallery = QtWidgets.QDockWidget("Gallery")
+        self.gallery = GalleryWidget(self.fileListWidget.model(), self.thumbnails)
+        self.gallery.rowSelected.connect(self.fileListWidget.setCurrentRow)
+        gallery.setWidget(self.gallery)
+        view_menu.addAction(gallery.toggleViewAction())
+        view_menu.addSeparator()
+        self.frame_stats = self.action("Frame Stats", tip="Show Handled and Coalesced Mouse Moves in the Status Bar")
+        self.frame_stats.setCheckable(True)
+        self.frame_stats.toggled.connect(self.toggleFrameStats)
+        view_menu.addAction(self.frame_stats)
+        self.statsTimer = QtCore.QTimer(self)
+        self.statsTimer.setInterval(1000)
+        self.statsTimer.timeout.connect(self.showFrameStats)
+
         self.addDockWidget(QtCore.Qt.DockWidgetArea.RightDockWidgetArea, self.label_list)
         self.addDockWidget(QtCore.Qt.DockWidgetArea.RightDockWidgetArea, self.polygon_label)
         self.addDockWidget(QtCore.Qt.DockWidgetArea.RightDockWidgetArea, file_list)
+        self.addDockWidget(QtCore.Qt.DockWidgetArea.BottomDockWidgetArea, gallery)
+        gallery.hide()
 
         # create toolbar
         toolbar = QtWidgets.QToolBar("Tool Bar")
@@ -224,6 +280,9 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.canvas.newShape.connect(self.newShape)
         self.canvas.selectionChanged.connect(self.shapeSelectionChanged)
+        self.canvas.shapesInserted.connect(self.shapesInserted)
+        self.canvas.shapesRemoved.connect(self.shapesRemoved)
+        self.canvas.shapesChanged.connect(self.shapesChanged)
 
         self.videoDialog = VideoSelectDialog()
         self.videoDialog.loadImgSignal.connect(self.scanAllImages)
@@ -260,13 +319,15 @@ class MainWindow(QtWidgets.QMainWindow):
             except IndexError:
                 return
 
-        editDlg = LabelDialog(self, self.label_list.widget())
         shape = item.shape()
-        editDlg.setName.setText(shape.label)
-        if editDlg.exec():
-            text = editDlg.setName.text()
+        text = self.labelDialog.popUp(shape.label)
+        if text is not None:
+            before = (shape.label, shape.line_color)
             shape.label = text
             item.setText(shape.label)
+            if text != before[0]:
+                self.labelRegistry.use(text)
+                self.canvas.relabelShape(shape, before)
 
         else:
             return
@@ -303,27 +364,25 @@ class MainWindow(QtWidgets.QMainWindow):
             polygon = LabelListWidgetItem(text, shape)
             color = self.UNIQUE_LABEL_DATA['color']
             self.copyShapeColor(shape, color)
+            self.labelRegistry.use(text)
             self.polygon_list.addItem(polygon)
             self.DRAW_UNIQUE = 0
             self.label_list.widget().selectionModel().clearSelection()
             return
-        labelDlg = LabelDialog(self, self.label_list.widget())
-        if labelDlg.exec():
-            text = labelDlg.setName.text()
+        text = self.labelDialog.popUp()
+        if text is not None:
             shape = self.canvas.setLastLabel(text, None)  # none flag
             polygon = LabelListWidgetItem(text, shape)
-            if len(self.canvas.shapes) > 0:
-                # for item in self.polygon_list.allItemList():
-                for item in self.label_list.widget().allItemList():
-                    if polygon.text() == item.text():
-                        self.copyShapeColor(shape, item.color())
-                        break
-                    else:
-                        self.setNewColor(shape)
+            color = self.labelRegistry.color(text)
+            if color is None:
+                self.setNewColor(shape)
+            else:
+                self.copyShapeColor(shape, color)
+            self.labelRegistry.use(text)
             self.polygon_list.addItem(polygon)
 
         else:
-            self.canvas.shapes.pop()
+            self.canvas.discardLastShape()
 
     def drawUniqMode(self, item):
         if self.canvas.editing():
@@ -340,6 +399,23 @@ class MainWindow(QtWidgets.QMainWindow):
             item = self.polygon_list.itemFromShape(shape)
             self.polygon_list.removeItem(item)
 
+    # undo/redo : keep the polygon list in step with the canvas
+    def shapesInserted(self, shapes):
+        for shape in shapes:
+            row = self.canvas.shapes.index(shape)
+            self.polygon_list.insertItem(row, LabelListWidgetItem(shape.label, shape))
+
+    def shapesRemoved(self, shapes):
+        for shape in shapes:
+            self.polygon_list.removeItem(self.polygon_list.itemFromShape(shape))
+
+    def shapesChanged(self, shapes):
+        for shape in shapes:
+            item = self.polygon_list.itemFromShape(shape)
+            if item.text() != shape.label:
+                item.setText(shape.label)
+        self.polygon_list.viewport().update()
+
     def shapeSelectionChanged(self, selected_shapes):
         self._noSelectionSignal = True
         self.polygon_list.clearSelection()
@@ -349,8 +425,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         for shape in self.canvas.selectedShapes:
             shape.selected = True
-            item = self.polygon_list.itemFromShape(shape)
-            self.polygon_list.selectItem(item)
+        self.polygon_list.selectItems([self.polygon_list.itemFromShape(s) for s in self.canvas.selectedShapes])
 
         self._noSelectionSignal = False
 
@@ -366,88 +441,108 @@ class MainWindow(QtWidgets.QMainWindow):
 
     # File list dock widget methods
     def loadItemSelection(self):
-        item = self.fileListWidget.selectedItems()
-        if not item:
+        rows = self.fileListWidget.selectedRows()
+        if not rows:
             return
-        item = item[0]
-        file = self.lastOpenDir + item.text()
+        file = self.lastOpenDir + self.fileListWidget.path(rows[0])
         self.loadFile(file)
+        self.prefetchImages(rows[0])
         # recent_file = QtGui.QAction(item.text(), self)
 
+    def prefetchImages(self, row):
+        rows = list(range(row + 1, row + 1 + self.PREFETCH_NEXT)) + list(range(row - 1, row - 1 - self.PREFETCH_PREV, -1))
+        files = [self.lastOpenDir + self.fileListWidget.path(r) for r in rows if 0 <= r < self.fileListWidget.count()]
+        self.imageCache.prefetch([file for file in files if not file.lower().endswith(".json")])
+
     def searchFile(self):
         self.SEARCH = 1
-        self.scanAllImages(
-            folderpath=self.lastOpenDir,
-            keyword=self.filesearch.text()
-        )
+        self.searchTimer.start()
 
-    def scanAllImages(self, folderpath, keyword=None):
+    def applySearch(self):
+        # answered from the in-memory index of the scanned paths, the disk is not touched
+        try:
+            ids = self.searchIndex.search(self.filesearch.text())
+        except re.error as e:
+            self.statusBar().showMessage(f"Invalid search pattern : {e}")
+            return
+        self.fileListWidget.model().setRows(ids if self.filesearch.text() else None)
+
+    def scanAllImages(self, folderpath):
         if not folderpath:
             return
-        self.lastOpenDir = folderpath
-        iterdir = QtCore.QDirIterator(folderpath, QtCore.QDirIterator.IteratorFlag.Subdirectories)
-        self.fileListWidget.clear()
-        images = list()
-        while iterdir.hasNext():
-            iterdir.next()
-            for i in [".jpg", ".jpeg", ".png"]:
-                if i in str(iterdir.filePath()):
-                    if keyword:
-                        if keyword in str(iterdir.filePath()):
-                            # self.fileListWidget.addItem(iterdir.filePath().replace(folderpath, ""))
-                            img = iterdir.filePath().replace(folderpath, "")
-                            images.append(img)
-
-                    else:
-                        img = iterdir.filePath().replace(folderpath, "")
-                        images.append(img)
-                        # self.fileListWidget.addItem(iterdir.filePath().replace(folderpath, ""))
-            if ".json" in str(iterdir.filePath()):
-                if keyword:
-                    if keyword in str(iterdir.filePath()):
-                        data = iterdir.filePath().replace(folderpath, "")
-                        images.append(data)
-
-                else:
-                    data = iterdir.filePath().replace(folderpath, "")
-                    images.append(data)
-
-        images = natsort.os_sorted(images)
-        for image in images:
-            self.fileListWidget.addItem(image)
-
-        if not self.SEARCH:
-            item = self.fileListWidget.item(0)
-            item.setSelected(True)
-            self.fileListWidget.scrollToItem(item)
-            file = self.lastOpenDir + item.text()
-            self.loadFile(file)
+        self.cancelScan()
+        if self.datasetIndex is None or self.datasetIndex.root != folderpath.rstrip("/\\"):
+            if self.datasetIndex is not None:
+                self.datasetIndex.close()
+            self.datasetIndex = DatasetIndex(folderpath, timeout=0.05)  # the GUI never waits on the scanner
+        self.lastOpenDir = self.datasetIndex.root
+        self.searchIndex.clear()
+        self.fileListWidget.model().setSource(self.searchIndex.paths, self.lastOpenDir)
+
+        # the walk runs on a worker thread, found paths are appended to the file list batch by batch
+        self.scanner = DirScanner(self.lastOpenDir, self)
+        self.scanner.batchFound.connect(functools.partial(self.addScannedImages, self.scanner))
+        self.scanner.progress.connect(functools.partial(self.scanProgress, self.scanner))
+        self.scanner.finished.connect(functools.partial(self.scanFinished, self.scanner))
+        self.scanCancel.setVisible(True)
+        self.scanner.start()
+
+    def addScannedImages(self, scanner, images):
+        if scanner is not self.scanner:  # batch of a cancelled scan still in the event queue
+            return
+        start = len(self.searchIndex)
+        self.searchIndex.add(images)
+        ids = range(start, len(self.searchIndex))
+        query = self.filesearch.text()
+        if query:
+            try:
+                match = self.searchIndex.matcher(query)
+            except re.error:
+                return
+            ids = [i for i in ids if match(self.searchIndex.paths[i])]
+        if not ids:
+            return
+        first = self.fileListWidget.count() == 0
+        self.fileListWidget.model().extend(ids)
+
+        if first and not self.SEARCH:
+            self.fileListWidget.setCurrentRow(0)
+
+    def scanProgress(self, scanner, count):
+        if scanner is not self.scanner:
+            return
+        self.statusBar().showMessage(f"Scanning {self.lastOpenDir} : {count} files")
+
+    def scanFinished(self, scanner):
+        if scanner is not self.scanner:
+            return
+        self.scanCancel.setVisible(False)
+        self.statusBar().showMessage(f"{self.fileListWidget.count()} files in {self.lastOpenDir}")
+        self.scanner = None
+
+    def cancelScan(self):
+        if self.scanner is None:
+            return
+        scanner = self.scanner
+        self.scanner = None
+        scanner.cancel()
+        self.scanCancel.setVisible(False)
 
     def loadNextImage(self):
         if self.label_autoSave.isChecked():
             self.saveFile()
-        if not self.fileListWidget.item(0):
-            return
-        index = self.fileListWidget.selectedIndexes()[0].row()
-        index += 1
-        item = self.fileListWidget.item(index)
-        if item is None:
+        row = self.fileListWidget.currentRow()
+        if row == -1 or row + 1 >= self.fileListWidget.count():
             return
-        item.setSelected(True)
-        self.fileListWidget.scrollToItem(item)
+        self.fileListWidget.setCurrentRow(row + 1)
 
     def loadPrevImage(self):
         if self.label_autoSave.isChecked():
             self.saveFile()
-        if not self.fileListWidget.item(0):
-            return
-        index = self.fileListWidget.selectedIndexes()[0].row()
-        index -= 1
-        item = self.fileListWidget.item(index)
-        if item is None:
+        row = self.fileListWidget.currentRow()
+        if row < 1:
             return
-        item.setSelected(True)
-        self.fileListWidget.scrollToItem(item)
+        self.fileListWidget.setCurrentRow(row - 1)
 
     def setCreateMode(self):
         self.canvas.setEditing(False)
@@ -459,6 +554,19 @@ class MainWindow(QtWidgets.QMainWindow):
         self.edit_box.setEnabled(False)
         self.draw_box.setEnabled(True)
 
+    def toggleFrameStats(self, checked):
+        self.canvas.moveStats()  # start counting from now
+        if checked:
+            self.statsTimer.start()
+        else:
+            self.statsTimer.stop()
+            self.statusBar().clearMessage()
+
+    def showFrameStats(self):
+        received, handled = self.canvas.moveStats()
+        self.statusBar().showMessage(f"Mouse moves/s : {received} received, {handled} handled, "
+                                     f"{received - handled} coalesced")
+
     def action(self, name, icon=None, shortcut=None, tip=None):
         if icon:
             action = QtGui.QAction(newIcon(icon), name, self)
@@ -490,8 +598,10 @@ class MainWindow(QtWidgets.QMainWindow):
         print(self.OUTPUT)
 
     def img_open(self):
-        filename, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Open Image/Label File",
-                                                            ".", "Image&Label(*.png *.xpm *.jpg *.jpeg *.json)")
+        dialog = FileDialogPreview(self, "Open Image/Label File", ".", "Image&Label(*.png *.xpm *.jpg *.jpeg *.json)",
+                                   thumbnails=self.thumbnails)
+        filename = dialog.selectedFiles()[0] if dialog.exec() else ""
+        dialog.deleteLater()
         if filename != "":
             if "json" in filename:
                 self.loadJson(filename)
@@ -505,15 +615,19 @@ class MainWindow(QtWidgets.QMainWindow):
     def video_open(self):
         self.videoDialog.open()
 
-    def img_depth(self, file):
-        try:
-            data = PIL.Image.open(file)
-            bpp = mode_to_bpp[data.mode]
-            if bpp != 1:
-                bpp /= 8
-            return int(bpp)
-        except FileNotFoundError:
-            return -1
+    def probeFile(self, filename):
+        # header probe, answered from the dataset index when the file did not change since
+        index = self.datasetIndex
+        path = None
+        if index is not None and filename.startswith(index.root):
+            path = filename[len(index.root):]
+            info = index.imageInfo(path)
+            if info is not None:
+                return info
+        info = probeImage(filename)
+        if path is not None:
+            index.setImageInfo(path, info)
+        return info
 
     def loadFile(self, filename=None):
         if ".json" in filename:
@@ -525,25 +639,66 @@ class MainWindow(QtWidgets.QMainWindow):
         self.canvas.setEnabled(False)
         self.canvas.resetState()
         self.polygon_list.clear()
-        self.color = []
-        # self.imageData = self.load_image_file(filename)
-        # image = QtGui.QImage.fromData(self.imageData)
-        image = QtGui.QImage(filename)
-        self.image = image
-        self.imageDepth = self.img_depth(filename)
-        if self.imageDepth == -1:
+        try:
+            self.imageInfo = self.probeFile(filename)
+        except OSError:
+            self.image = QtGui.QImage()
             message = QtWidgets.QMessageBox.critical(self, "File Not Found Error", f"No such file or directory: {filename}")
             if message:
                 return
+        width, height = self.imageInfo.displaySize()
+        pyramid = None
+        if width * height > TILED_IMAGE_PIXELS:
+            # never decoded whole : tiles are read from the file, an overview stands in for self.image
+            pyramid = TilePyramid(filename, self.imageInfo)
+            image = pyramid.overview(self.previewSize(self.imageInfo) or
+                                     QtCore.QSize(width, height).scaled(2048, 2048, QtCore.Qt.AspectRatioMode.KeepAspectRatio))
+        else:
+            image = self.imageCache.get(filename)  # decoded ahead of time when paging through the list
+            if image is None:
+                size = self.previewSize(self.imageInfo)
+                if size is not None:
+                    image = decodePreview(filename, size)
+            if image is None:
+                image = self.imageCache.load(filename)
+        if image.isNull():
+            self.image = image
+            QtWidgets.QMessageBox.critical(self, "Image Decode Error", f"Cannot decode {filename}")
+            return
+        self.image = image
         self.filename = filename
         # self.canvas.loadPixmap(QtGui.QPixmap.fromImage(image))
-        self.canvas.loadPixmap(QtGui.QPixmap.fromImage(image))
+        if pyramid is not None:
+            self.canvas.loadPyramid(pyramid)
+        else:
+            self.canvas.loadImage(image, imageSize=QtCore.QSize(width, height))
+        self.journal.begin(filename, [])
         self.canvas.setEnabled(True)
+        self.adjustScale(initial=True)  # before painting, a stale zoom would ask for full resolution
         self.paintCanvas()
         self.canvas.setFocus()
-        self.adjustScale(initial=True)
         self.recentFileAction(filename)
 
+    def previewSize(self, info):
+        # size the image is shown at when fit to the window, None when that is close to full resolution
+        w1 = self.centralWidget().width() - 2.0
+        h1 = self.centralWidget().height() - 2.0
+        width, height = info.displaySize()
+        scale = min(w1 / width, h1 / height)
+        if scale > self.PREVIEW_MAX_SCALE:
+            return None
+        return QtCore.QSize(math.ceil(width * scale), math.ceil(height * scale))
+
+    def imageLoaded(self, filename):
+        # full resolution decode finished, swap it in for the preview keeping shapes and zoom
+        if filename != self.filename or not self.canvas.isPreview():
+            return
+        image = self.imageCache.get(filename)
+        if image is None:
+            return
+        self.image = image
+        self.canvas.loadImage(image, clear_shapes=False)
+
     def saveFile(self):
         if not self.filename:
             return
@@ -565,9 +720,10 @@ class MainWindow(QtWidgets.QMainWindow):
         data = dict()
 
         data['image_filename'] = imgName
-        data['image_size'] = {'width': self.image.width(),
-                              'height': self.image.height(),
-                              'depth': self.imageDepth}
+        width, height = self.imageInfo.displaySize()  # upright size, the boxes are drawn on it
+        data['image_size'] = {'width': width,
+                              'height': height,
+                              'depth': self.imageInfo.depth}
         data['image_path'] = file[:file.rfind('/')+1]
 
         Object = list()
@@ -585,6 +741,11 @@ class MainWindow(QtWidgets.QMainWindow):
         if save != "":
             with open(save, "w", encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent="\t")
+            self.journal.begin(file, self.canvas.shapes, savePath=save)  # saved, the journal starts over
+            index = self.datasetIndex
+            if index is not None and file.startswith(index.root) and \
+                    osp.splitext(osp.abspath(save))[0] == osp.splitext(osp.abspath(file))[0]:
+                index.setHasJson(file[len(index.root):])  # a label next to the image, as a scan finds it
 
     def loadJson(self, file):
         try:
@@ -606,16 +767,62 @@ class MainWindow(QtWidgets.QMainWindow):
         shapeList = list()
         for object in data['Object']:
             label = object['object_name']
-            shape = Shape(label=label)
+            shape = Shape(label=label, store=self.canvas.store)
             point1 = QtCore.QPoint(object['object_coor']['x1'], object['object_coor']['y1'])
             point2 = QtCore.QPoint(object['object_coor']['x2'], object['object_coor']['y2'])
-            shape.addPoint(point1)
-            shape.addPoint(point2)
+            shape.points = [point1, point2]
+            shapeList.append(shape)
+        self.canvas.loadShapes(shapeList)  # indexes rebuilt once
+        self.addShapeItems(shapeList)
+        self.journal.begin(self.filename, shapeList, savePath=file)
+
+    def recoverJournal(self):
+        # edits the last session did not save, left in the journal
+        state = self.journal.recover()
+        if state is None:
+            return
+        filename, savePath, rows = state
+        if not osp.exists(filename):
+            return
+        fDir = filename[:filename.rfind('/')]
+        if self.lastOpenDir is None:  # a scanned folder keeps its root, the file list paths hang off it
+            self.lastOpenDir = fDir
+        if not self.OUTPUT:
+            self.outputDir = fDir
+        self.loadFile(filename)
+        shapeList = list()
+        for row in rows:
+            shape = Shape(label=row[0], store=self.canvas.store)
+            coords = row[1:]
+            point = QtCore.QPoint if all(isinstance(c, int) for c in coords) else QtCore.QPointF
+            shape.points = [point(coords[i], coords[i + 1]) for i in range(0, len(coords), 2)]
             shapeList.append(shape)
         self.canvas.loadShapes(shapeList)
-        for shape in shapeList:
-            item = LabelListWidgetItem(shape.label, shape)
-            self.polygon_list.addItem(item)
+        self.addShapeItems(shapeList)
+        self.defaultSavePath = savePath
+        self.journal.begin(filename, shapeList, savePath=savePath, dirty=True)
+        self.statusBar().showMessage(f"Recovered {len(shapeList)} unsaved boxes of {osp.basename(filename)}", 10000)
+
+    def addShapeItems(self, shapes):
+        # loaded shapes : labels registered and colors set once per label here, the items
+        # go into the list in one row insert, which emits no itemChanged per item
+        uniq = self.label_list.widget()
+        for shape in shapes:
+            color = self.labelRegistry.color(shape.label)
+            if color is None:
+                self.setNewColor(shape)
+                uniq.addItem(UniqLabelListWidgetItem(shape.label, shape.line_color))
+            else:
+                self.copyShapeColor(shape, color)
+        self.polygon_list.addItems([LabelListWidgetItem(shape.label, shape) for shape in shapes])
+
+    def closeEvent(self, event):
+        self.cancelScan()
+        self.imageCache.clear()
+        self.imageCache.pool.waitForDone()
+        self.thumbnails.shutdown()
+        self.journal.close()
+        super(MainWindow, self).closeEvent(event)
 
     def resizeEvent(self, event):
         if self.canvas and not self.image.isNull() and self.zoomMode != self.MANUAL_ZOOM:
@@ -625,6 +832,8 @@ class MainWindow(QtWidgets.QMainWindow):
     def paintCanvas(self):  # loadfile, zoom value changed
         assert not self.image.isNull(), "cannot paint null image"
         self.canvas.scale = 0.01 * self.zoomWidget.value()  # zoomWidget.value is percentage
+        if self.canvas.isPreview() and self.canvas.scale * self.canvas.imageSize.width() > self.canvas.pixmap.width():
+            self.imageCache.request(self.filename)  # zoomed past the preview resolution
         self.canvas.adjustSize()
         self.canvas.update()
 
@@ -649,94 +858,26 @@ class MainWindow(QtWidgets.QMainWindow):
         w1 = self.centralWidget().width() - e
         h1 = self.centralWidget().height() - e
         a1 = w1/h1
-        w2 = self.canvas.pixmap.width() - 0.0
-        h2 = self.canvas.pixmap.height() - 0.0
+        w2 = self.canvas.imageSize.width() - 0.0
+        h2 = self.canvas.imageSize.height() - 0.0
         a2 = w2/h2
         return w1/w2 if a2 >= a1 else h1/h2
 
     def scaleFitWidth(self):
         w = self.centralWidget().width() - 2.0
-        return w / self.canvas.pixmap.width()
+        return w / self.canvas.imageSize.width()
 
     def setNewColor(self, shape, r=None, g=None, b=None):
         if r is None:
-            color = list(np.random.choice(range(256), size=3))
-            while color in self.color:
-                color = list(np.random.choice(range(256), size=3))
-            self.color.append(color)
-            r, g, b = color
-        shape.line_color = QtGui.QColor(r, g, b, 128)
-        shape.vertex_fill_color = QtGui.QColor(r, g, b, 255)
-        shape.fill_color = QtGui.QColor(r, g, b, 128)
-        shape.select_fill_color = QtGui.QColor(r, g, b, 155)
+            r, g, b = labelColor(shape.label)
+        shape.setColor(int(r), int(g), int(b))
 
     def setLabelColor(self, label, shape):
         r = label.line_color.red()
         g = label.line_color.green()
         b = label.line_color.blue()
-        shape.line_color = QtGui.QColor(r, g, b, 128)
-        shape.vertex_fill_color = QtGui.QColor(r, g, b, 255)
-        shape.fill_color = QtGui.QColor(r, g, b, 128)
-        shape.select_fill_color = QtGui.QColor(r, g, b, 155)
-
-    @staticmethod
-    def load_image_file(filename):
-        image_pil = PIL.Image.open(filename)
-
-        # apply orientation to image according to exif
-        image_pil = MainWindow.apply_exif_orientation(image_pil)
-
-        with io.BytesIO() as f:
-            format = "PNG"
-            image_pil.save(f, format=format)
-            f.seek(0)
-            return f.read()
-
-    @staticmethod
-    def apply_exif_orientation(image):
-        try:
-            exif = image._getexif()
-        except AttributeError:
-            exif = None
-
-        if exif is None:
-            print("exif is none")
-            return image
-
-        exif = {
-            PIL.ExifTags.TAGS[k]: v
-            for k, v in exif.items()
-            if k in PIL.ExifTags.TAGS
-        }
-        print(exif)
-        orientation = exif.get("Orientation", None)
-
-        if orientation == 1:
-            # do nothing
-            return image
-        elif orientation == 2:
-            # left-to-right mirror
-            return PIL.ImageOps.mirror(image)
-        elif orientation == 3:
-            # rotate 180
-            return image.transpose(PIL.Image.ROTATE_180)
-        elif orientation == 4:
-            # top-to-bottom mirror
-            return PIL.ImageOps.flip(image)
-        elif orientation == 5:
-            # top-to-left mirror
-            return PIL.ImageOps.mirror(image.transpose(PIL.Image.ROTATE_270))
-        elif orientation == 6:
-            # rotate 270
-            return image.transpose(PIL.Image.ROTATE_270)
-        elif orientation == 7:
-            # top-to-right mirror
-            return PIL.ImageOps.mirror(image.transpose(PIL.Image.ROTATE_90))
-        elif orientation == 8:
-            # rotate 90
-            return image.transpose(PIL.Image.ROTATE_90)
-        else:
-            return image
+        shape.setColor(r, g, b)
+
     # def img_load(self, filename):
     #     image = QtGui.QImage(filename)
     #     pixmap = QtGui.QPixmap.fromImage(image)
@@ -798,7 +939,8 @@ class MainWindow(QtWidgets.QMainWindow):
     #     painter.end()
     #     self.label.setPixmap(self.canvas)
 
-app = QtWidgets.QApplication(sys.argv)
-window = MainWindow()
-window.show()
-app.exec()
+if __name__ == '__main__':  # thumbnail worker processes import this module on spawn platforms
+    app = QtWidgets.QApplication(sys.argv)
+    window = MainWindow()
+    window.show()
+    app.exec()
@@ -2,6 +2,10 @@ from PyQt6 import QtCore, QtGui, QtWidgets
 
 from math import sqrt
 from Shape import Shape
+from utils.shape_store import ShapeStore
+from utils.spatial_index import GridIndex
+from utils.hit_test import BoxHitTester
+from utils.shape_commands import CreateShapesCommand, DeleteShapesCommand, MoveShapesCommand, RelabelShapeCommand
 
 import sys
 
@@ -13,6 +17,11 @@ CURSOR_GRAB = QtCore.Qt.CursorShape.OpenHandCursor
 
 MOVE_SPEED = 5.0
 
+GRID_CELLS = 64  # hit-test grid cells along the longer image side
+LAYER_MAX_PIXELS = 32 * 1024 * 1024  # larger views are painted directly, without a cached layer
+LIVE_REGION_RECTS = 64  # more live shapes are repainted in their bounding rect instead of one rect each
+MOVE_INTERVAL = 16  # ms, mouse moves are handled at most once per display frame
+
 
 class Canvas(QtWidgets.QWidget):
     zoomRequest = QtCore.pyqtSignal(int, QtCore.QPoint)
@@ -20,6 +29,10 @@ class Canvas(QtWidgets.QWidget):
     newShape = QtCore.pyqtSignal()
     selectionChanged = QtCore.pyqtSignal(list)
     shapeMoved = QtCore.pyqtSignal()
+    # undo/redo changes, for the label list to follow
+    shapesInserted = QtCore.pyqtSignal(list)
+    shapesRemoved = QtCore.pyqtSignal(list)
+    shapesChanged = QtCore.pyqtSignal(list)
     drawingPolygon = QtCore.pyqtSignal(bool)
     vertexSelected = QtCore.pyqtSignal(bool)
 
@@ -38,18 +51,26 @@ class Canvas(QtWidgets.QWidget):
 
         self.mode = self.EDIT
         self.shapes = list()
-        self.shapesBackups = list()
+        self.shapeIndex = GridIndex()  # bounding rect grid over self.shapes, same z-order
+        self.hitTester = BoxHitTester()  # batched hover hit-testing, same z-order
+        self.undoStack = QtGui.QUndoStack(self)
+        self.undoStack.setUndoLimit(self.num_backups)
+        self.journal = None  # AnnotationJournal recording every change of self.shapes
+        self._moveStart = list()  # (shape, points) when the left button went down
         self.current = None  # current shape
         self.selectedShapes = list()
         self.selectedShapesCopy = list()
         self.createMode = "rectangle"
 
-        self.line = Shape()
+        self.store = ShapeStore()  # rows of the shapes of the open image, see clearShapes
+        self.line = Shape(store=self.store)
         self.prevPoint = QtCore.QPoint()
         self.prevMovePoint = QtCore.QPoint()
         self.offsets = QtCore.QPoint(), QtCore.QPoint()
         self.scale = 1.0
         self.pixmap = QtGui.QPixmap()
+        self.pyramid = None
+        self.imageSize = QtCore.QSize()  # full resolution size, shape coordinates live in this space
         self.visible = dict()
         self._hideBackround = False
         self.hideBackround = False
@@ -63,8 +84,21 @@ class Canvas(QtWidgets.QWidget):
         self.snapping = True
         self.hShapeIsSelected = False
         self._painter = QtGui.QPainter()
+        self._layer = None  # (key, origin, pixmap) : image and static shapes of the visible rect
+        self._layerRevision = 0  # bumped when a static shape or the visibility changes
+        self._detached = set()  # shapes moved since the layer was rendered, drawn on top instead
         self._cursor = CURSOR_DEFAULT
 
+        # mouse moves arriving within MOVE_INTERVAL of the last handled one are coalesced,
+        # only the latest position is handled when the interval ends
+        self._pendingMove = None  # (pos, buttons)
+        self._moveTimer = QtCore.QTimer(self)
+        self._moveTimer.setSingleShot(True)
+        self._moveTimer.setInterval(MOVE_INTERVAL)
+        self._moveTimer.timeout.connect(self.flushMouseMove)
+        self._movesReceived = 0
+        self._movesHandled = 0
+
         self.menus = (QtWidgets.QMenu(), QtWidgets.QMenu())
 
         self.setMouseTracking(True)
@@ -76,32 +110,68 @@ class Canvas(QtWidgets.QWidget):
     def setFillDrawing(self, value):
         self._fill_drawing = value
 
-    # copy shapes list to shapesBackups list
-    def storeShapes(self):
-        shapesBackup = list()
-        for shape in self.shapes:
-            shapesBackup.append(shape.copy())
-        if len(self.shapesBackups) > self.num_backups:
-            self.shapesBackups = self.shapesBackups[-self.num_backups - 1:]
-        self.shapesBackups.append(shapesBackup)
+    # edits are pushed to undoStack as commands holding only the shapes they changed
+    def pushCommand(self, command):
+        self.undoStack.push(command)
+        if self.journal is not None:
+            command.record(self.journal)
 
     @property
     def isShapeRestorable(self):
-        #  to be in the undo stack
-        if len(self.shapesBackups) < 2:
-            return False
-        return True
+        return self.undoStack.canUndo()
 
     def restoreShape(self):
-        if not self.isShapeRestorable:
-            return
-        self.shapesBackups.pop()  # latest
+        self.undoStack.undo()
+
+    def redoShape(self):
+        self.undoStack.redo()
+
+    def insertShapes(self, entries):
+        # entries : (index, shape) pairs in ascending index order
+        middle = False
+        for index, shape in entries:
+            middle = middle or index < len(self.shapes)
+            self.shapes.insert(index, shape)
+        if middle:
+            self.rebuildShapeIndex()  # z-order of the indexes follows self.shapes
+        else:
+            for _, shape in entries:
+                self.indexShape(shape)
+        if self.journal is not None:
+            self.journal.insert(entries)
+        shapes = [s for _, s in entries]
+        self.shapesInserted.emit(shapes)
+        self.update()
 
-        shapesBackup = self.shapesBackups.pop()
-        self.shapes = shapesBackup
-        self.selectedShapes = []
-        for shape in self.shapes:
+    def removeShapes(self, shapes):
+        if self.journal is not None:
+            self.journal.remove([self.shapes.index(s) for s in shapes])
+        for shape in shapes:
             shape.selected = False
+            if shape in self.selectedShapes:
+                self.selectedShapes.remove(shape)
+            self.shapes.remove(shape)
+            self.unindexShape(shape)
+        if self.hShape in shapes:
+            self.unHighlight()
+        self.shapesRemoved.emit(shapes)
+        self.update()
+
+    def setShapesPoints(self, changes):
+        for shape, points in changes:
+            shape.points = points
+            self.reindexShape(shape)
+        if self.journal is not None:
+            self.journal.setPoints([(self.shapes.index(s), points) for s, points in changes])
+        self.shapesChanged.emit([s for s, _ in changes])
+        self.update()
+
+    def setShapeLabel(self, shape, label, color):
+        shape.label = label
+        shape.line_color = color
+        if self.journal is not None:
+            self.journal.setLabel(self.shapes.index(shape), label)
+        self.shapesChanged.emit([shape])
         self.update()
 
     def enterEvent(self, ev):
@@ -132,7 +202,7 @@ class Canvas(QtWidgets.QWidget):
     def unHighlight(self):
         if self.hShape:
             self.hShape.highlightClear()  # Shape::highlightClear
-            self.update()
+            self.updateShapes([self.hShape])
         self.prevhShape = self.hShape
         self.prevhVertex = self.hVertex
         self.prevhEdge = self.hEdge
@@ -145,9 +215,31 @@ class Canvas(QtWidgets.QWidget):
         return self.hEdge is not None
 
     def mouseMoveEvent(self, ev):
+        self._movesReceived += 1
+        self._pendingMove = (ev.pos(), ev.buttons())
+        if not self._moveTimer.isActive():
+            self.flushMouseMove()
+
+    def flushMouseMove(self):
+        # handle the latest pending move and hold the next ones back for one frame
+        if self._pendingMove is None:
+            return
+        pos, buttons = self._pendingMove
+        self._pendingMove = None
+        self._movesHandled += 1
+        self._moveTimer.start()
+        self.handleMouseMove(pos, buttons)
+
+    def moveStats(self):
+        # (mouse moves received, handled) since the last call, the difference was coalesced
+        stats = (self._movesReceived, self._movesHandled)
+        self._movesReceived = self._movesHandled = 0
+        return stats
+
+    def handleMouseMove(self, pos, buttons):
         #  update line according to points and coordinates
         try:
-            pos = self.transformPos(ev.pos())
+            pos = self.transformPos(pos)
         except AttributeError:
             return
         self.prevMovePoint = pos
@@ -161,33 +253,36 @@ class Canvas(QtWidgets.QWidget):
                 # Prevent to draw outside the pixmap
                 pos = self.intersectionPoint(pos)
 
+            before = self.shapeRegion([self.current, self.line])
             if self.createMode == "rectangle":
                 self.line.points = [self.current[0], pos]
                 self.line.close()
-            self.repaint()
             self.current.highlightClear()
+            self.updateShapes([self.current, self.line], before)
             return
 
         #  rectangle copy moving
-        if ev.buttons() == QtCore.Qt.MouseButton.RightButton:
+        if buttons == QtCore.Qt.MouseButton.RightButton:
             if self.selectedShapesCopy and self.prevPoint:
                 self.overrideCursor(CURSOR_MOVE)
+                before = self.shapeRegion(self.selectedShapesCopy)
                 self.boundedMoveShapes(self.selectedShapesCopy, pos)
-                self.repaint()
+                self.updateShapes(self.selectedShapesCopy, before)
             elif self.selectedShapes:
                 self.selectedShapesCopy = [s.copy() for s in self.selectedShapes]
-                self.repaint()
+                self.updateShapes(self.selectedShapesCopy)
             return
 
         # rectangle/vertex moving
-        if ev.buttons() == QtCore. Qt.MouseButton.LeftButton:
+        if buttons == QtCore. Qt.MouseButton.LeftButton:
             if self.selectedVertex():
                 if self.outOfPixmap(pos):
                     # Prevent to draw outside the pixmap
                     pos = self.intersectionPoint(pos)
 
+                before = self.shapeRegion([self.hShape])
                 self.boundedMoveVertex(pos)
-                self.repaint()
+                self.updateShapes([self.hShape], before)
                 self.movingShape = True
 
             elif self.selectedShapes and self.prevPoint:
@@ -195,17 +290,23 @@ class Canvas(QtWidgets.QWidget):
                 if self.outOfPixmap(pos):
                     # Prevent to draw outside the pixmap
                     pos = self.intersectionPoint(pos)
+                before = self.shapeRegion(self.selectedShapes)
                 self.boundedMoveShapes(self.selectedShapes, pos)
-                self.repaint()
+                self.updateShapes(self.selectedShapes, before)
                 self.movingShape = True
             return
 
         self.setToolTip(self.tr("Image"))
-        for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
+        hovered = (self.hShape, self.hVertex)
+        # shapes with a vertex nearby or containing pos, topmost first. only the shapes of
+        # the grid cells within reach are tested
+        radius = self.epsilon / self.scale
+        candidates = self.shapeIndex.query(pos, radius)
+        for shape, index, index_edge in self.hitTester.hits(pos, radius, self.epsilon, candidates):
+            if not self.isVisible(shape):
+                continue
             # nearby Vertex to highlight
             # else if inside a shape
-            index = shape.nearestVertex(pos, self.epsilon / self.scale)
-            index_edge = shape.nearestEdge(pos, self.epsilon)
             if index is not None:
                 if self.selectedVertex():
                     self.hShape.highlightClear()
@@ -217,10 +318,9 @@ class Canvas(QtWidgets.QWidget):
                 self.overrideCursor(CURSOR_POINT)
                 self.setToolTip(self.tr("Click & drag to move point"))
                 self.setStatusTip(self.toolTip())
-                self.update()
                 break
 
-            elif shape.containsPoint(pos):
+            else:
                 if self.selectedVertex():
                     self.hShape.highlightClear()
                 self.prevhVertex = self.hVertex
@@ -231,14 +331,17 @@ class Canvas(QtWidgets.QWidget):
                 self.setToolTip(self.tr(f"Click & drag to move shape {shape.label}"))
                 self.setStatusTip(self.toolTip())
                 self.overrideCursor(CURSOR_GRAB)
-                self.update()
                 break
 
         else:  # nothing found. clear highlight. reset state
             self.unHighlight()
+        if (self.hShape, self.hVertex) != hovered:
+            # fill and vertex highlight changed on the previous and the new hovered shape only
+            self.updateShapes([hovered[0], self.hShape])
         self.vertexSelected.emit(self.hVertex is not None)
 
     def mousePressEvent(self, ev):
+        self.flushMouseMove()  # press where the pointer is, not where the last handled move left it
         pos = self.transformPos(ev.pos())
         if ev.button() == QtCore.Qt.MouseButton.LeftButton:
             if self.drawing():
@@ -249,7 +352,7 @@ class Canvas(QtWidgets.QWidget):
 
                 elif not self.outOfPixmap(pos):
                     # create new shape
-                    self.current = Shape()
+                    self.current = Shape(store=self.store)
                     self.current.addPoint(pos)
 
             elif self.editing():
@@ -259,6 +362,10 @@ class Canvas(QtWidgets.QWidget):
                 group_mode = ev.modifiers() == QtCore.Qt.Modifier.CTRL
                 self.selectShapePoint(pos, multiple_selection_mode=group_mode)
                 self.prevPoint = pos
+                moving = set(self.selectedShapes)
+                if self.hShape is not None:
+                    moving.add(self.hShape)
+                self._moveStart = [(s, s.points) for s in moving]
                 self.repaint()
 
         elif ev.button() == QtCore.Qt.MouseButton.RightButton and self.editing():
@@ -269,6 +376,7 @@ class Canvas(QtWidgets.QWidget):
             self.prevPoint = pos
 
     def mouseReleaseEvent(self, ev):
+        self.flushMouseMove()
         if ev.button() == QtCore.Qt.MouseButton.RightButton:
             menu = self.menus[len(self.selectedShapesCopy) > 0]
             self.restoreCursor()
@@ -283,11 +391,12 @@ class Canvas(QtWidgets.QWidget):
                     self.selectionChanged.emit([x for x in self.selectedShapes if x != self.hShape])
 
         if self.movingShape and self.hShape:
-            index = self.shapes.index(self.hShape)
-            if self.shapesBackups[-1][index].points != self.shapes[index].points:
-                self.storeShapes()
+            moves = [(s, before, s.points) for s, before in self._moveStart if s.points != before]
+            if moves:
+                self.pushCommand(MoveShapesCommand(self, moves))
                 self.shapeMoved.emit()
             self.movingShape = False
+        self._moveStart = []
 
     def addPointToEdge(self):
         shape = self.prevhShape
@@ -309,14 +418,19 @@ class Canvas(QtWidgets.QWidget):
         if copy:
             for i, shape in enumerate(self.selectedShapesCopy):
                 self.shapes.append(shape)
+                self.indexShape(shape)
                 self.selectedShapes[i].selected = False
                 self.selectedShapes[i] = shape
+            self.pushCommand(CreateShapesCommand(self, self.selectedShapesCopy))
         else:
+            moves = list()
             for i, shape in enumerate(self.selectedShapesCopy):
+                moves.append((self.selectedShapes[i], self.selectedShapes[i].points, shape.points))
                 self.selectedShapes[i].points = shape.points
+                self.reindexShape(self.selectedShapes[i])
+            self.pushCommand(MoveShapesCommand(self, moves))
         self.selectedShapesCopy = []
         self.repaint()
-        self.storeShapes()
         return True
 
     def hideBackroundShapes(self, value):
@@ -347,7 +461,7 @@ class Canvas(QtWidgets.QWidget):
             index, shape = self.hVertex, self.hShape
             shape.highlightVertex(index, shape.MOVE_VERTEX)
         else:
-            for shape in reversed(self.shapes):
+            for shape in self.shapeIndex.query(point):
                 if self.isVisible(shape) and shape.containsPoint(point):
                     self.setHiding()
                     if shape not in self.selectedShapes:
@@ -363,9 +477,9 @@ class Canvas(QtWidgets.QWidget):
         self.deSelectShape()
 
     def calculateOffsets(self, point):
-        left = self.pixmap.width() - 1  # qrect() right-left
+        left = self.imageSize.width() - 1  # qrect() right-left
         right = 0
-        top = self.pixmap.height() - 1  # qrect() bottom-top
+        top = self.imageSize.height() - 1  # qrect() bottom-top
         bottom = 0
         for s in self.selectedShapes:
             rect = s.boundingRect()
@@ -381,12 +495,13 @@ class Canvas(QtWidgets.QWidget):
         y1 = top - point.y()
         x2 = right - point.x()
         y2 = bottom - point.y()
-        self.offsets = QtCore.QPoint(x1, y1), QtCore.QPoint(x2, y2)
+        self.offsets = QtCore.QPoint(int(x1), int(y1)), QtCore.QPoint(int(x2), int(y2))
 
     def boundedMoveVertex(self, pos):
         index, shape = self.hVertex, self.hShape
         point = shape[index]
         shape.moveVertexBy(index, pos - point)
+        self.reindexShape(shape)
 
     def boundedMoveShapes(self, shapes, pos):
         if self.outOfPixmap(pos):
@@ -401,14 +516,15 @@ class Canvas(QtWidgets.QWidget):
         o2 = pos + self.offsets[1]  # x2, y2
         if self.outOfPixmap(o2):
             pos += QtCore.QPoint(
-                min(0, self.pixmap.width() - o2.x()),
-                min(0, self.pixmap.height() - o2.y())
+                min(0, self.imageSize.width() - o2.x()),
+                min(0, self.imageSize.height() - o2.y())
             )
 
         dp = pos - self.prevPoint
         if dp:
             for shape in shapes:
                 shape.moveBy(dp)
+                self.reindexShape(shape)
             self.prevPoint = pos
             return True
         return False
@@ -423,10 +539,12 @@ class Canvas(QtWidgets.QWidget):
     def deleteSelected(self):
         deleted_shapes = []
         if self.selectedShapes:
+            entries = [(self.shapes.index(s), s) for s in self.selectedShapes]
             for shape in self.selectedShapes:
                 self.shapes.remove(shape)
+                self.unindexShape(shape)
                 deleted_shapes.append(shape)
-            self.storeShapes()
+            self.pushCommand(DeleteShapesCommand(self, entries))
             self.selectedShapes = []
             self.update()
         return deleted_shapes
@@ -435,8 +553,9 @@ class Canvas(QtWidgets.QWidget):
         if shape in self.selectedShapes:
             self.selectedShapes.remove(shape)
         if shape in self.shapes:
+            self.pushCommand(DeleteShapesCommand(self, [(self.shapes.index(shape), shape)]))
             self.shapes.remove(shape)
-        self.storeShapes()
+            self.unindexShape(shape)
         self.update()
 
     def boundedShiftShape(self, shapes):
@@ -448,23 +567,45 @@ class Canvas(QtWidgets.QWidget):
             self.boundedMoveShapes(shapes, point + offset)
 
     def paintEvent(self, event):
-        if not self.pixmap:
+        if self.imageSize.isEmpty():
             return super(Canvas, self).paintEvent(event)
         # print("paintevent occurred")
         p = self._painter  # QPainter()
         p.begin(self)
-        p.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
-        p.setRenderHint(QtGui.QPainter.RenderHint.SmoothPixmapTransform)
-
-        p.scale(self.scale, self.scale)
-        p.translate(self.offsetToCenter())  # 좌표계 평행이동 points + offsetToCenter
-        p.drawPixmap(0, 0, self.pixmap)  # draw pixmap on (0, 0)
-
         Shape.scale = self.scale
-        for shape in self.shapes:
-            if (shape.selected or not self._hideBackround) and self.isVisible(shape):
-                shape.fill = shape.selected or shape == self.hShape
-                shape.paint(p)
+        visible = self.visibleRegion().boundingRect()
+        layer = self.staticLayer(visible) if visible.contains(event.rect()) else None
+        if layer is not None:
+            # image and static shapes come from the cached layer, the live shapes are drawn on top.
+            # the layer holds the plain look of the live shapes too : under them the image and
+            # the other shapes are painted directly instead, so every shape is drawn once
+            _, origin, pixmap = layer
+            rect = event.rect()
+            live = list(self.selectedShapes)
+            if self.hShape is not None and self.hShape not in live and self.hShape in self.hitTester:
+                live.append(self.hShape)
+            live.extend(s for s in self._detached if s not in live)
+            holes = self.liveRegion(live).intersected(QtGui.QRegion(rect))
+            dpr = pixmap.devicePixelRatio()
+            source = rect.translated(-origin)
+            p.setClipRegion(QtGui.QRegion(rect).subtracted(holes))
+            p.drawPixmap(QtCore.QRectF(rect), pixmap, QtCore.QRectF(source.x() * dpr, source.y() * dpr,
+                                                                     source.width() * dpr, source.height() * dpr))
+            p.setClipRegion(holes)  # widget coordinates, before beginPaint transforms them
+            self.beginPaint(p)
+            if not holes.isEmpty():
+                bounds = holes.boundingRect()
+                self.paintImage(p, self.imageRect(bounds))
+                skip = set(live)
+                self.paintShapes(p, [s for s in self.shapesIn(bounds) if s not in skip], plain=True)
+            p.setClipping(False)
+            exposed = self.exposedRect(rect)
+            self.paintShapes(p, live, (exposed.left(), exposed.top(), exposed.right(), exposed.bottom()))
+        else:
+            self.beginPaint(p)
+            # only the exposed part : the image area under event.rect() and the shapes crossing it
+            self.paintImage(p, self.imageRect(event.rect()))
+            self.paintShapes(p, self.shapesIn(event.rect()))
 
         if self.current:
             self.current.paint(p)
@@ -477,24 +618,130 @@ class Canvas(QtWidgets.QWidget):
 
         p.end()
 
+    def beginPaint(self, p):
+        p.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
+        p.setRenderHint(QtGui.QPainter.RenderHint.SmoothPixmapTransform)
+
+        p.scale(self.scale, self.scale)
+        p.translate(self.offsetToCenter())  # 좌표계 평행이동 points + offsetToCenter
+
+    def paintImage(self, p, rect):  # rect in image coordinates
+        exposed = rect.intersected(QtCore.QRectF(QtCore.QPointF(0, 0), QtCore.QSizeF(self.imageSize)))
+        if self.pyramid is not None:
+            self.pyramid.paint(p, exposed, self.scale)
+        elif self.isPreview():  # about window sized, drawn whole
+            p.drawPixmap(QtCore.QRectF(QtCore.QPointF(0, 0), QtCore.QSizeF(self.imageSize)),
+                         self.pixmap, QtCore.QRectF(self.pixmap.rect()))
+        elif not exposed.isEmpty():
+            source = exposed.toAlignedRect()
+            p.drawPixmap(source, self.pixmap, source)
+
+    def paintShapes(self, p, shapes, clip=None, plain=False):
+        # plain : the look of shapes neither selected nor hovered, for the cached layer
+        painted = list()
+        for shape in shapes:
+            if (not self._hideBackround or shape.selected and not plain) and self.isVisible(shape):
+                if not plain:
+                    shape.fill = shape.selected or shape == self.hShape
+                painted.append(shape)
+        Shape.paintBatch(p, painted, clip, plain)
+
+    def exposedRect(self, rect):  # image area a shape must touch to paint into the widget rect
+        margin = self.dirtyMargin() / self.scale
+        return self.imageRect(rect).adjusted(-margin, -margin, margin, margin)
+
+    def shapesIn(self, rect):  # shapes painting into the widget rect, in z-order
+        return self.hitTester.intersecting(self.exposedRect(rect))
+
+    def isLive(self, shape):
+        # drawn every frame on top of the cached layer
+        return shape.selected or shape is self.hShape
+
+    def staticLayer(self, visible):
+        # image and the plain look of every shape, rendered once for the visible widget rect.
+        # hovering or selecting only changes what is drawn on top, the layer stays valid
+        dpr = self.devicePixelRatioF()
+        if visible.isEmpty() or visible.width() * visible.height() * dpr * dpr > LAYER_MAX_PIXELS:
+            return None
+        key = (self.scale, visible, self._layerRevision, self._hideBackround, self.pixmap.cacheKey(),
+               id(self.pyramid), self.imageSize, self.store.colorRevision)
+        if self._layer is not None and self._layer[0] == key:
+            return self._layer
+        self._detached = {s for s in self._detached if self.isLive(s)}  # the others go back in the layer
+        pixmap = QtGui.QPixmap(round(visible.width() * dpr), round(visible.height() * dpr))
+        pixmap.setDevicePixelRatio(dpr)
+        pixmap.fill(QtCore.Qt.GlobalColor.transparent)
+        p = QtGui.QPainter(pixmap)
+        p.translate(-QtCore.QPointF(visible.topLeft()))
+        self.beginPaint(p)
+        self.paintImage(p, self.imageRect(visible))
+        self.paintShapes(p, [s for s in self.shapesIn(visible) if s not in self._detached], plain=True)
+        p.end()
+        self._layer = (key, visible.topLeft(), pixmap)
+        return self._layer
+
+    def dirtyMargin(self):
+        # widget pixels a shape paints beyond its box : largest vertex handle, pen and antialiasing
+        return Shape.point_size * 2 + max(2.0, self.scale) + 2
+
+    def widgetRect(self, rect):  # rect in image coordinates -> widget rect, dirtyMargin included
+        offset = self.offsetToCenter()
+        s, m = self.scale, self.dirtyMargin()
+        return QtCore.QRectF((rect.x() + offset.x()) * s - m, (rect.y() + offset.y()) * s - m,
+                             rect.width() * s + 2 * m, rect.height() * s + 2 * m).toAlignedRect()
+
+    def shapeRegion(self, shapes):
+        region = QtCore.QRect()
+        for shape in shapes:
+            if shape is None or not len(shape):
+                continue
+            points = shape.points
+            xs = [p.x() for p in points]
+            ys = [p.y() for p in points]
+            region = region.united(self.widgetRect(QtCore.QRectF(QtCore.QPointF(min(xs), min(ys)),
+                                                                 QtCore.QPointF(max(xs), max(ys)))))
+        return region
+
+    def liveRegion(self, shapes):
+        # widget area of each shape, a single rect around many
+        if len(shapes) > LIVE_REGION_RECTS:
+            return QtGui.QRegion(self.shapeRegion(shapes))
+        region = QtGui.QRegion()
+        for shape in shapes:
+            region = region.united(self.shapeRegion([shape]))
+        return region
+
+    def updateShapes(self, shapes, before=None):
+        # repaint only where shapes are now, and were before a change when given their old region
+        region = self.shapeRegion(shapes)
+        if before is not None:
+            region = region.united(before)
+        if not region.isEmpty():
+            self.update(region)
+
+    def imageRect(self, rect):  # widget rect -> rect in image coordinates
+        offset = self.offsetToCenter()
+        return QtCore.QRectF(rect.x() / self.scale - offset.x(), rect.y() / self.scale - offset.y(),
+                             rect.width() / self.scale, rect.height() / self.scale)
+
     def transformPos(self, point):  # 위젯 중앙을 원점으로(default : top left) 했을 때의 좌표
         return point / self.scale - self.offsetToCenter()
 
     def offsetToCenter(self):
         s = self.scale
         area = super(Canvas, self).size()
-        w, h = self.pixmap.width() * s, self.pixmap.height() * s  # scaled width, height
+        w, h = self.imageSize.width() * s, self.imageSize.height() * s  # scaled width, height
         aw, ah = area.width(), area.height()
         x = (aw - w) / (2*s) if aw > w else 0
         y = (ah - h) / (2*s) if ah > h else 0
         return QtCore.QPoint(int(x), int(y))
 
     def outOfPixmap(self, p):
-        w, h = self.pixmap.width(), self.pixmap.height()
+        w, h = self.imageSize.width(), self.imageSize.height()
         return not (0 <= p.x() <= w - 1 and 0 <= p.y() <= h - 1)
 
     def intersectionPoint(self, point):
-        size = self.pixmap.size()
+        size = self.imageSize
         x2, y2 = point.x(), point.y()
 
         x2BesideLeft = {True: 0, False: size.width()-1 if x2 > (size.width()-1) else x2}
@@ -508,7 +755,7 @@ class Canvas(QtWidgets.QWidget):
         assert self.current
         self.current.close()
         self.shapes.append(self.current)
-        self.storeShapes()
+        self.indexShape(self.current)
         self.current = None
         self.setHiding(False)
         self.newShape.emit()
@@ -521,25 +768,34 @@ class Canvas(QtWidgets.QWidget):
         return self.minimumSizeHint()
 
     def minimumSizeHint(self):
-        if self.pixmap:
-            return self.scale * self.pixmap.size()
+        if not self.imageSize.isEmpty():
+            return self.scale * self.imageSize
         return super(Canvas, self).minimumSizeHint()
 
     def setLastLabel(self, text, flags):
         assert text
         self.shapes[-1].label = text
         self.shapes[-1].flags = flags
-        self.shapesBackups.pop()
-        self.storeShapes()
+        self.pushCommand(CreateShapesCommand(self, [self.shapes[-1]]))  # labelled, the shape is kept
         return self.shapes[-1]
 
+    def relabelShape(self, shape, before):
+        # before : (label, line color) prior to an edit already applied to shape
+        self.pushCommand(RelabelShapeCommand(self, shape, before, (shape.label, shape.line_color)))
+
     def undoLastLine(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self.unindexShape(self.current)
         self.current.setOpen()
         self.current.points = self.current.points[0:1]
         self.drawingPolygon.emit(True)
 
+    def discardLastShape(self):  # label dialog cancelled
+        shape = self.shapes.pop()
+        self.unindexShape(shape)
+        self.update()
+
     def undoLastPoint(self):
         if not self.current or self.current.isClosed():
             return
@@ -551,26 +807,90 @@ class Canvas(QtWidgets.QWidget):
             self.drawingPolygon.emit(False)
         self.update()
 
+    def loadImage(self, image, clear_shapes=True, imageSize=None):
+        if imageSize is not None and imageSize != image.size():
+            # reduced resolution preview stretched over the full resolution image space
+            self.loadPixmap(QtGui.QPixmap.fromImage(image), clear_shapes)
+            self.imageSize = QtCore.QSize(imageSize)
+            return
+        self.loadPixmap(QtGui.QPixmap.fromImage(image), clear_shapes)
+
+    def loadPyramid(self, pyramid, clear_shapes=True):
+        # no full resolution pixmap : only the tiles of the exposed area at the zoom's mip level
+        self.pixmap = QtGui.QPixmap()
+        self.pyramid = pyramid
+        self.imageSize = QtCore.QSize(pyramid.width, pyramid.height)
+        if clear_shapes:
+            self.clearShapes()
+        self.rebuildShapeIndex()
+        self.update()
+
+    def isPreview(self):
+        return not self.pixmap.isNull() and self.pixmap.size() != self.imageSize
+
     def loadPixmap(self, pixmap, clear_shapes=True):
         self.pixmap = pixmap
+        self.pyramid = None
+        self.imageSize = pixmap.size()
         if clear_shapes:
-            self.shapes = []
+            self.clearShapes()
+        self.rebuildShapeIndex()
         self.update()
 
+    def clearShapes(self):
+        # a new image gets a new store : the rows and interned labels of the last one go
+        # with its shapes at once, not row by row as the garbage collector gets to them
+        self.shapes = []
+        self.undoStack.clear()
+        self.store = ShapeStore()
+        self.line = Shape(store=self.store)
+        self.current = None
+
     def loadShapes(self, shapes, replace=True):
         if replace:
             self.shapes = list(shapes)
+            self.rebuildShapeIndex()
         else:
             self.shapes.extend(shapes)
-        self.storeShapes()
+            for shape in shapes:
+                self.indexShape(shape)
+        self.undoStack.clear()  # loaded shapes are the baseline
         self.current = None
         self.hShape = None
         self.hVertex = None
         self.hEdge = None
         self.update()
 
+    def rebuildShapeIndex(self):
+        # cells scale with the image so the grid stays around GRID_CELLS x GRID_CELLS
+        side = max(self.imageSize.width(), self.imageSize.height(), GRID_CELLS)
+        boxes = Shape.boxes(self.shapes)  # read once for both indexes
+        self.shapeIndex.rebuild(self.shapes, cellSize=side / GRID_CELLS, boxes=boxes)
+        self.hitTester.rebuild(self.shapes, boxes)
+        self._detached = set()
+        self._layerRevision += 1
+
+    def indexShape(self, shape):
+        self.shapeIndex.insert(shape)
+        self.hitTester.insert(shape)
+        self._layerRevision += 1
+
+    def reindexShape(self, shape):
+        self.shapeIndex.update(shape)
+        self.hitTester.update(shape)
+        if shape not in self._detached:  # left out of the layer once, then drawn on top while it moves
+            self._detached.add(shape)
+            self._layerRevision += 1
+
+    def unindexShape(self, shape):
+        self.shapeIndex.remove(shape)
+        self.hitTester.remove(shape)
+        self._detached.discard(shape)
+        self._layerRevision += 1
+
     def setShapeVisible(self, shape, value):
         self.visible[shape] = value
+        self._layerRevision += 1
         self.update()
 
     def overrideCursor(self, cursor):
@@ -584,7 +904,9 @@ class Canvas(QtWidgets.QWidget):
     def resetState(self):
         self.restoreCursor()
         self.pixmap = QtGui.QPixmap()
-        self.shapesBackups = []
+        self.pyramid = None
+        self.imageSize = QtCore.QSize()
+        self.undoStack.clear()
         self.update()
 
     def distance(self, p):
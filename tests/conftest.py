@@ -0,0 +1,36 @@
+import os
+import os.path as osp
+import sys
+
+import pytest
+from PyQt6 import QtCore, QtWidgets
+
+# the modules import each other from the repository root : utils.*, widgets.*, Shape
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # widgets without a display
+
+from Shape import Shape
+from utils.shape_store import ShapeStore
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    # widgets and QObjects with timers need an application object, no event loop runs
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def store():
+    # a store per test, like the canvas keeps one per image
+    return ShapeStore()
+
+
+@pytest.fixture
+def box(store):
+    # box(x1, y1, x2, y2, label=None) : a rectangle shape in store, QPoints for int corners
+    def box(x1, y1, x2, y2, label=None):
+        point = QtCore.QPoint if all(isinstance(v, int) for v in (x1, y1, x2, y2)) else QtCore.QPointF
+        shape = Shape(label=label, store=store)
+        shape.points = [point(x1, y1), point(x2, y2)]
+        return shape
+    return box
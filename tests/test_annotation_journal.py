@@ -0,0 +1,136 @@
+import json
+import os
+
+import pytest
+from PyQt6 import QtCore
+
+from utils.annotation_journal import AnnotationJournal, lockSlot, replay, shapeRow
+
+
+@pytest.fixture
+def journal(qapp, tmp_path):
+    journal = AnnotationJournal(str(tmp_path))
+    yield journal
+    journal.close()
+
+
+def lines(journal):
+    with open(journal.path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_shape_row(box):
+    assert shapeRow(box(1, 2, 30, 40, "car")) == ["car", 1, 2, 30, 40]
+
+
+def test_replay_nothing():
+    assert replay([]) is None
+    assert replay([{"op": "label", "index": 0, "label": "x"}]) is None  # edits without an open entry
+
+
+def test_replay_edits():
+    entries = [
+        {"op": "open", "image": "/a.jpg", "save": "/a.json", "shapes": [["car", 0, 0, 10, 10], ["dog", 5, 5, 20, 20]]},
+        {"op": "insert", "shapes": [[1, "cat", 1, 1, 2, 2], [3, "cow", 3, 3, 4, 4]]},
+        {"op": "points", "shapes": [[0, 1, 1, 11, 11]]},
+        {"op": "label", "index": 2, "label": "bird"},
+        {"op": "remove", "indices": [1, 3]},
+    ]
+    image, save, rows = replay(entries)
+    assert (image, save) == ("/a.jpg", "/a.json")
+    assert rows == [["car", 1, 1, 11, 11], ["bird", 5, 5, 20, 20]]
+
+
+def test_replay_last_open_wins():
+    entries = [
+        {"op": "open", "image": "/a.jpg", "save": None, "shapes": []},
+        {"op": "insert", "shapes": [[0, "car", 0, 0, 1, 1]]},
+        {"op": "open", "image": "/b.jpg", "save": None, "shapes": [["dog", 1, 1, 2, 2]]},
+    ]
+    assert replay(entries) == ("/b.jpg", None, [["dog", 1, 1, 2, 2]])
+
+
+def test_nothing_written_before_the_first_edit(journal, box):
+    journal.begin("/a.jpg", [box(0, 0, 10, 10, "car")])
+    assert not os.path.exists(journal.path) or os.path.getsize(journal.path) == 0
+    assert journal.recover() is None
+
+
+def test_edits_recover(journal, box):
+    shapes = [box(0, 0, 10, 10, "car")]
+    journal.begin("/a.jpg", shapes, savePath="/a.json")
+    new = box(5, 5, 50, 50, "dog")
+    journal.insert([(1, new)])
+    journal.setPoints([(0, [QtCore.QPoint(2, 2), QtCore.QPoint(12, 12)])])
+    journal.setLabel(1, "cat")
+    journal.remove([0])
+    assert [line["op"] for line in lines(journal)] == ["open", "insert", "points", "label", "remove"]
+    assert journal.recover() == ("/a.jpg", "/a.json", [["cat", 5, 5, 50, 50]])
+
+
+def test_dirty_begin_writes_the_open_entry(journal, box):
+    journal.begin("/a.jpg", [box(0, 0, 10, 10, "car")], dirty=True)
+    assert journal.recover() == ("/a.jpg", None, [["car", 0, 0, 10, 10]])
+
+
+def test_begin_starts_over(journal, box):
+    journal.begin("/a.jpg", [])
+    journal.insert([(0, box(0, 0, 10, 10, "car"))])
+    journal.begin("/a.jpg", [box(0, 0, 10, 10, "car")], savePath="/a.json")  # saved
+    assert os.path.getsize(journal.path) == 0
+    assert journal.recover() is None
+
+
+def test_torn_last_line(journal, box):
+    journal.begin("/a.jpg", [])
+    journal.insert([(0, box(0, 0, 10, 10, "car"))])
+    journal.setLabel(0, "truck")
+    journal.close()
+    with open(journal.path, "rb+") as f:
+        f.truncate(os.path.getsize(journal.path) - 5)  # the crash cut the label line short
+    assert journal.recover() == ("/a.jpg", None, [["car", 0, 0, 10, 10]])
+
+
+def test_inconsistent_journal(journal):
+    with open(journal.path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "open", "image": "/a.jpg", "save": None, "shapes": []}) + "\n")
+        f.write(json.dumps({"op": "label", "index": 3, "label": "x"}) + "\n")
+    assert journal.recover() is None
+
+
+def test_running_instances_get_their_own_journal(qapp, tmp_path, box):
+    first = AnnotationJournal(str(tmp_path))
+    second = AnnotationJournal(str(tmp_path))
+    assert first.path != second.path
+    first.begin("/a.jpg", [])
+    first.insert([(0, box(0, 0, 10, 10, "car"))])
+    second.begin("/b.jpg", [])  # truncates its own journal only
+    second.insert([(0, box(0, 0, 10, 10, "dog"))])
+    assert first.recover() == ("/a.jpg", None, [["car", 0, 0, 10, 10]])
+    assert second.recover() == ("/b.jpg", None, [["dog", 0, 0, 10, 10]])
+    first.close()
+    second.close()
+
+
+def test_next_instance_recovers_a_closed_journal(qapp, tmp_path, box):
+    idle = AnnotationJournal(str(tmp_path))  # slot 0, nothing to recover
+    left = AnnotationJournal(str(tmp_path))
+    left.begin("/a.jpg", [])
+    left.insert([(0, box(0, 0, 10, 10, "car"))])
+    left.close()  # exited without saving
+    idle.close()
+    later = AnnotationJournal(str(tmp_path))
+    assert later.path == left.path  # the slot with leftover work is taken first
+    assert later.recover() == ("/a.jpg", None, [["car", 0, 0, 10, 10]])
+    later.close()
+
+
+def test_lock_slot_skips_held_slots(qapp, tmp_path):
+    path, lock = lockSlot(str(tmp_path))
+    other, otherLock = lockSlot(str(tmp_path))
+    assert path != other
+    lock.unlock()
+    again, againLock = lockSlot(str(tmp_path))
+    assert again == path
+    otherLock.unlock()
+    againLock.unlock()
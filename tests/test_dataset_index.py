@@ -0,0 +1,137 @@
+import os
+
+import natsort
+import pytest
+
+from utils.dataset_index import DatasetIndex, indexPath
+from utils.image_probe import ImageInfo
+
+FILES = [
+    "a.jpg", "img2.png", "img10.png", "img1.json", "img1.jpg",
+    "sub/b.jpg", "sub/deep/c.png", "sub/deep/c.json",
+    "Z/x-1.jpg", "Z/x_1.jpg", "10/9.jpg", "9/10.jpg",
+    "notes.txt", "sub/readme.md",
+]
+
+
+def touch(root, rel):
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+    return path
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "dataset"
+    for rel in FILES:
+        touch(root, rel)
+    return root
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def walk(root):
+    # every indexed path in the order of one os_sorted call over them all
+    paths = list()
+    for d, _, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith((".jpg", ".jpeg", ".png", ".json")):
+                paths.append(os.path.join(d, name)[len(str(root)):])
+    return natsort.os_sorted(paths)
+
+
+def bumpMtime(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_index_lives_in_the_cache(root, cache):
+    index = DatasetIndex(str(root), directory=cache)
+    index.refresh()
+    index.close()
+    assert index.path == indexPath(str(root), cache)
+    assert os.path.exists(index.path)
+    assert not any(name.endswith(".sqlite3") for name in os.listdir(root))
+
+
+def test_scan_order_is_os_sorted(root, cache):
+    index = DatasetIndex(str(root), directory=cache)
+    assert index.refresh() == walk(root)
+    index.close()
+
+
+def test_scan_yields_runs_in_order(root, cache):
+    index = DatasetIndex(str(root), directory=cache)
+    runs = list(index.scan())
+    assert all(runs)
+    assert [path for run in runs for path in run] == walk(root)
+    index.close()
+
+
+def test_rescan_from_index(root, cache, monkeypatch):
+    DatasetIndex(str(root), directory=cache).refresh()
+    index = DatasetIndex(str(root), directory=cache)
+
+    def rescanDir(rel, mtime):
+        raise AssertionError(f"{rel} listed again")
+
+    monkeypatch.setattr(index, "_rescanDir", rescanDir)  # nothing changed, all from the index
+    assert index.refresh() == walk(root)
+
+
+def test_rescan_picks_up_changes(root, cache):
+    index = DatasetIndex(str(root), directory=cache)
+    index.refresh()
+    touch(root, "sub/deep/d.jpg")
+    touch(root, "new/e.png")
+    os.remove(root / "img2.png")
+    for d in ("sub/deep", "new", ""):
+        bumpMtime(root / d)  # coarse mtime file systems would miss a change within the same tick
+    paths = index.refresh()
+    assert paths == walk(root)
+    assert "/sub/deep/d.jpg" in paths and "/new/e.png" in paths and "/img2.png" not in paths
+
+
+def test_rescan_forgets_removed_dirs(root, cache):
+    index = DatasetIndex(str(root), directory=cache)
+    index.refresh()
+    for name in os.listdir(root / "sub" / "deep"):
+        os.remove(root / "sub" / "deep" / name)
+    os.rmdir(root / "sub" / "deep")
+    bumpMtime(root / "sub")
+    assert index.refresh() == walk(root)
+    assert index.conn.execute("SELECT COUNT(*) FROM dirs WHERE path LIKE '/sub/deep%'").fetchone()[0] == 0
+
+
+def test_has_json(root, cache):
+    index = DatasetIndex(str(root), directory=cache)
+    index.refresh()
+    assert index.fileInfo("/img1.jpg")["has_json"] == 1
+    assert index.fileInfo("/a.jpg")["has_json"] == 0
+    index.setHasJson("/a.jpg")
+    assert index.fileInfo("/a.jpg")["has_json"] == 1
+
+
+def test_image_info_until_the_file_changes(root, cache):
+    index = DatasetIndex(str(root), directory=cache)
+    index.refresh()
+    assert index.imageInfo("/a.jpg") is None
+    info = ImageInfo(640, 480, 3, 6)
+    index.setImageInfo("/a.jpg", info)
+    assert index.imageInfo("/a.jpg") == info
+    (root / "a.jpg").write_bytes(b"changed")
+    assert index.imageInfo("/a.jpg") is None
+
+
+def test_image_info_survives_unchanged_rescan(root, cache):
+    index = DatasetIndex(str(root), directory=cache)
+    index.refresh()
+    index.setImageInfo("/a.jpg", ImageInfo(640, 480, 3, 1))
+    touch(root, "f.jpg")
+    bumpMtime(root)
+    index.refresh()  # root listed again, a.jpg did not change
+    assert index.imageInfo("/a.jpg") == ImageInfo(640, 480, 3, 1)
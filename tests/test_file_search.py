@@ -0,0 +1,99 @@
+import re
+
+import pytest
+
+from utils.file_search import FileSearchIndex, globLiterals, regexLiterals
+
+PATHS = [
+    "/a/abbbc.jpg",
+    "/a/ac.jpg",
+    "/a/img_001.png",
+    "/a/img_010.png",
+    "/b/img_002.jpg",
+    "/b/labels/img_002.json",
+    "/c/x.y.jpg",
+]
+
+
+@pytest.fixture
+def index():
+    index = FileSearchIndex()
+    index.add(PATHS)
+    return index
+
+
+@pytest.mark.parametrize("pattern, literals", [
+    ("img*_0?.jpg", ["img", "_0", ".jpg"]),
+    ("[ab]/img*", ["/img"]),
+    ("*.png", [".png"]),
+])
+def test_glob_literals(pattern, literals):
+    assert globLiterals(pattern) == literals
+
+
+@pytest.mark.parametrize("pattern, literals", [
+    ("ab{1,3}c", ["ab", "c"]),
+    ("ab{2}cd", ["ab", "cd"]),
+    ("ab{0,3}cd", ["a", "cd"]),
+    ("ab{,3}cd", ["a", "cd"]),
+    ("ab{1,3}?cde", ["ab", "cde"]),
+    ("a{b", ["a{b"]),
+    (r"\x41bc", ["bc"]),
+    (r"ab\u00e9cd", ["ab", "cd"]),
+    (r"ab\U0001F600cd", ["ab", "cd"]),
+    (r"\N{LATIN SMALL LETTER E}tude", ["tude"]),
+    (r"ab\1cd", ["ab", "cd"]),
+    (r"img_\060\d", ["img_"]),
+    ("abc?d", ["ab", "d"]),
+    ("abc*d", ["ab", "d"]),
+    ("abc+d", ["abc", "d"]),
+    (r"img_\d+\.png", ["img_", ".png"]),
+    (r"x\.?jpg", ["x", "jpg"]),
+    ("[0-9]+.jpg", ["jpg"]),
+    ("a(b|c)", []),
+    ("ab|cd", []),
+])
+def test_regex_literals(pattern, literals):
+    assert regexLiterals(pattern) == literals
+
+
+def test_search_substring(index):
+    assert index.search("img_00") == [2, 4, 5]
+    assert index.search("c") == [0, 1, 6]  # too short for trigrams, scanned
+    assert index.search("") == list(range(len(PATHS)))
+    assert index.search("missing") == []
+
+
+def test_search_glob(index):
+    assert index.search("img_0?0.png") == [3]
+    assert index.search("*.json") == [5]
+    assert index.search("/b/*") == [4, 5]
+
+
+def test_search_regex(index):
+    assert index.search("re:ab{1,3}c") == [0]
+    assert index.search("re:ab{0,3}c\\.jpg") == [0, 1]
+    assert index.search(r"re:img_0\d[02]\.(png|jpg)") == [3, 4]
+    assert index.search(r"re:^/c/x\.y") == [6]
+
+
+@pytest.mark.parametrize("query", [
+    "re:ab{1,3}c", "re:ab{0,3}c", "re:b+c", "re:img_0+1", r"re:\d{3}\.png", "re:a.c",
+    r"re:\x61bbbc", r"re:\u0069mg_00", r"re:\N{LATIN SMALL LETTER I}mg_01", r"re:img_0\060\d", r"re:(b)\1bc",
+    "img", "?c.jpg", "*_00[12]*",
+])
+def test_search_matches_full_scan(index, query):
+    match = index.matcher(query)
+    assert index.search(query) == [i for i, path in enumerate(PATHS) if match(path)]
+
+
+def test_bad_regex_raises(index):
+    with pytest.raises(re.error):
+        index.search("re:ab(")
+
+
+def test_add_after_search(index):
+    assert index.search("img_00") == [2, 4, 5]
+    index.add(["/d/img_003.png"])
+    assert index.search("img_00") == [2, 4, 5, 7]
+    assert index.search("re:img_00[3]") == [7]
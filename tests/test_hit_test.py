@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+from PyQt6 import QtCore
+
+from Shape import Shape
+from utils.hit_test import BoxHitTester
+from utils.spatial_index import GridIndex
+
+VERTEX_EPSILON = 8.0
+EDGE_EPSILON = 5.0
+
+
+def referenceHits(shapes, point):
+    # the per shape hover scan of the canvas, topmost first
+    hits = list()
+    for shape in reversed(shapes):
+        vertex = shape.nearestVertex(point, VERTEX_EPSILON)
+        edge = shape.nearestEdge(point, EDGE_EPSILON)
+        if vertex is not None or shape.containsPoint(point):
+            hits.append((shape, vertex, edge))
+    return hits
+
+
+@pytest.fixture
+def shapes(box, store):
+    # whole corners on a small canvas, so points often fall on edges and vertices
+    rng = np.random.default_rng(0)
+    shapes = [box(*corners) for corners in rng.integers(0, 200, (150, 4)).astype(float).tolist()]
+    for x, y in rng.integers(0, 200, (10, 2)).astype(float).tolist():
+        single = Shape(store=store)
+        single.points = [QtCore.QPointF(x, y)]
+        shapes.insert(int(rng.integers(len(shapes))), single)
+    shapes.insert(5, Shape(store=store))  # no points yet, never hits
+    return shapes
+
+
+def points(seed, n=40):
+    rng = np.random.default_rng(seed)
+    whole = rng.integers(-10, 210, (n, 2)).astype(float)
+    return [QtCore.QPointF(x, y) for x, y in np.vstack((whole, rng.uniform(-10, 210, (n, 2)))).tolist()]
+
+
+def assertSameHits(tester, shapes, index=None):
+    for point in points(1):
+        candidates = None if index is None else index.query(point, VERTEX_EPSILON)
+        assert list(tester.hits(point, VERTEX_EPSILON, EDGE_EPSILON, candidates)) == referenceHits(shapes, point)
+
+
+def assertSameAnswers(tester, shapes):
+    for point in points(2, 20):
+        vertices = tester.nearestVertices(point, VERTEX_EPSILON)
+        edges = tester.nearestEdges(point, EDGE_EPSILON)
+        inside = tester.contains(point)
+        for shape, vertex, edge, contains in zip(shapes, vertices, edges, inside):
+            assert (None if vertex < 0 else vertex) == shape.nearestVertex(point, VERTEX_EPSILON)
+            assert (None if edge < 0 else edge) == shape.nearestEdge(point, EDGE_EPSILON)
+            assert contains == shape.containsPoint(point)
+
+
+def test_per_row_answers_match_shape_methods(shapes):
+    tester = BoxHitTester()
+    tester.rebuild(shapes)
+    assertSameAnswers(tester, shapes)
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_hits_match_shape_methods(shapes, bulk):
+    tester = BoxHitTester()
+    if bulk:
+        tester.rebuild(shapes, Shape.boxes(shapes))
+    else:
+        for shape in shapes:
+            tester.insert(shape)
+    assert len(tester) == len(shapes)
+    assertSameHits(tester, shapes)
+
+
+def test_hits_with_grid_candidates(shapes):
+    tester = BoxHitTester()
+    tester.rebuild(shapes)
+    index = GridIndex(cellSize=32.0)
+    index.rebuild(shapes)
+    assertSameHits(tester, shapes, index)
+
+
+def test_hits_after_updates(shapes):
+    tester = BoxHitTester()
+    tester.rebuild(shapes)
+    index = GridIndex(cellSize=32.0)
+    index.rebuild(shapes)
+    for shape in shapes[::7]:
+        if len(shape):
+            shape.moveBy(QtCore.QPointF(13, -9))
+            tester.update(shape)
+            index.update(shape)
+    assertSameHits(tester, shapes)
+    assertSameHits(tester, shapes, index)
+
+
+def test_hits_after_removing_most_rows(shapes):
+    tester = BoxHitTester()
+    tester.rebuild(shapes)
+    index = GridIndex(cellSize=32.0)
+    index.rebuild(shapes)
+    rng = np.random.default_rng(3)
+    removed = set(rng.choice(len(shapes), size=len(shapes) * 4 // 5, replace=False).tolist())
+    for i in sorted(removed):
+        tester.remove(shapes[i])
+        index.remove(shapes[i])
+    live = [shape for i, shape in enumerate(shapes) if i not in removed]
+    assert len(tester) == len(live)
+    assert len(tester.boxes) < len(shapes)  # compacted
+    assertSameHits(tester, live)
+    assertSameHits(tester, live, index)
+
+    # inserted after the compaction : on top of every older shape
+    top = Shape(store=live[0]._store)
+    top.points = [QtCore.QPointF(0, 0), QtCore.QPointF(200, 200)]
+    tester.insert(top)
+    index.insert(top)
+    live.append(top)
+    assertSameHits(tester, live)
+    assertSameHits(tester, live, index)
+
+
+def test_intersecting_keeps_z_order(shapes):
+    tester = BoxHitTester()
+    tester.rebuild(shapes)
+    rect = QtCore.QRectF(50, 50, 40, 40)
+    expected = [shape for shape in shapes if len(shape) and shape.boundingRect().intersects(rect)]
+    found = tester.intersecting(rect)
+    assert [shape for shape in found if shape in expected] == expected
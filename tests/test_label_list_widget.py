@@ -0,0 +1,121 @@
+import pytest
+from PyQt6 import QtCore
+
+from widgets.label_list_widget import LabelListWidget, LabelListWidgetItem
+
+MOVE = QtCore.Qt.DropAction.MoveAction
+
+
+@pytest.fixture
+def widget(qapp):
+    return LabelListWidget()
+
+
+@pytest.fixture
+def shapes(box):
+    return [box(i, i, i + 10, i + 10, f"l{i}") for i in range(6)]
+
+
+@pytest.fixture
+def items(shapes):
+    # removed items are deleted with their rows, the tests hold on to the shapes
+    return [LabelListWidgetItem(shape.label, shape) for shape in shapes]
+
+
+def assertMapped(widget, removed=()):
+    # every listed shape maps to the item in its row, removed shapes are not found
+    for item in widget.allItemList():
+        assert widget.itemFromShape(item.shape()) is item
+    for shape in removed:
+        with pytest.raises(ValueError):
+            widget.itemFromShape(shape)
+
+
+def texts(widget):
+    return [item.text() for item in widget.allItemList()]
+
+
+def test_add_and_insert(widget, items, shapes):
+    for item in items[:3]:
+        widget.addItem(item)
+    widget.insertItem(1, items[3])
+    widget.insertItem(99, items[4])  # past the end : appended
+    assert texts(widget) == ["l0", "l3", "l1", "l2", "l4"]
+    assertMapped(widget, [shapes[5]])
+    with pytest.raises(TypeError):
+        widget.addItem(object())
+
+
+def test_add_items(widget, items):
+    widget.addItem(items[0])
+    widget.addItems(items[1:])
+    assert texts(widget) == ["l0", "l1", "l2", "l3", "l4", "l5"]
+    assertMapped(widget)
+
+
+def test_remove_and_clear(widget, items, shapes):
+    widget.addItems(items)
+    widget.removeItem(items[2])
+    widget.removeItem(items[0])
+    assert texts(widget) == ["l1", "l3", "l4", "l5"]
+    assertMapped(widget, [shapes[0], shapes[2]])
+    widget.clear()
+    assert widget.allItemList() == []
+    assertMapped(widget, shapes)
+    widget.addItem(LabelListWidgetItem("l2", shapes[2]))  # mapped again after a clear
+    assertMapped(widget, [shapes[0]])
+
+
+def drag(widget, rows, to, onto=None):
+    # what the view does for an internal move : drop, then remove the dragged rows
+    model = widget.model()
+    dropped = list()
+    model.itemDropped.connect(lambda: dropped.append(True))
+    data = model.mimeData([model.index(row, 0) for row in rows])
+    parent = model.index(onto, 0) if onto is not None else QtCore.QModelIndex()
+    target = onto if onto is not None else to if to >= 0 else model.rowCount()
+    assert model.dropMimeData(data, MOVE, to, 0, parent)
+    shift = len(rows) if target <= rows[0] else 0
+    model.removeRows(rows[0] + shift, len(rows))
+    assert dropped
+
+
+def test_move_down(widget, items, shapes):
+    widget.addItems(items)
+    drag(widget, [1, 2], 5)
+    assert texts(widget) == ["l0", "l3", "l4", "l1", "l2", "l5"]
+    assertMapped(widget)
+    assert widget.itemFromShape(shapes[1]) is widget.model().item(3)  # the clone in the new row
+
+
+def test_move_up_and_to_the_end(widget, items):
+    widget.addItems(items)
+    drag(widget, [3, 4], 0)
+    assert texts(widget) == ["l3", "l4", "l0", "l1", "l2", "l5"]
+    assertMapped(widget)
+    drag(widget, [0], -1)  # on the empty area below the rows
+    assert texts(widget) == ["l4", "l0", "l1", "l2", "l5", "l3"]
+    assertMapped(widget)
+
+
+def test_move_onto_an_item(widget, items):
+    widget.addItems(items)
+    drag(widget, [4], -1, onto=1)
+    assert texts(widget) == ["l0", "l4", "l1", "l2", "l3", "l5"]
+    assertMapped(widget)
+
+
+def test_move_keeps_the_check_state(widget, items, shapes):
+    widget.addItems(items)
+    items[2].setCheckState(QtCore.Qt.CheckState.Unchecked)
+    drag(widget, [2], 0)
+    assert widget.itemFromShape(shapes[2]).checkState() == QtCore.Qt.CheckState.Unchecked
+
+
+def test_mime_data_holds_rows_only(widget, items):
+    widget.addItems(items)
+    model = widget.model()
+    data = model.mimeData([model.index(4, 0), model.index(1, 0)])
+    assert data.formats() == model.mimeTypes()
+    assert bytes(data.data(model.mimeTypes()[0])) == b"1,4"
+    assert not model.dropMimeData(data, QtCore.Qt.DropAction.CopyAction, 0, 0, QtCore.QModelIndex())
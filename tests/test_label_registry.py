@@ -0,0 +1,112 @@
+from utils.label_registry import LabelRegistry, isSubsequence
+from utils.label_trie import LabelTrie
+
+
+def registry(*names):
+    labels = LabelRegistry()
+    for name in names:
+        labels.register(name)
+    return labels
+
+
+def test_trie_prefix():
+    trie = LabelTrie()
+    for index, key in enumerate(["car", "cart", "cat", "dog"]):
+        trie.insert(key, index)
+    assert trie.prefix("ca") == [0, 1, 2]
+    assert trie.prefix("car") == [0, 1]
+    assert trie.prefix("cart") == [1]
+    assert trie.prefix("cow") == []
+    assert trie.prefix("") == [0, 1, 2, 3]
+    trie.clear()
+    assert trie.prefix("") == []
+
+
+def test_is_subsequence():
+    assert isSubsequence("prsn", "person")
+    assert not isSubsequence("nosrep", "person")
+    assert isSubsequence("", "person")
+
+
+def test_register():
+    labels = LabelRegistry()
+    assert labels.register("car", color="red")
+    assert not labels.register("car", color="blue")
+    assert labels.register("dog")
+    assert "car" in labels and "cow" not in labels
+    assert len(labels) == 2
+    assert (labels.id("car"), labels.id("dog"), labels.id("cow")) == (0, 1, None)
+    assert labels.color("car") == "red"
+
+
+def test_use_counts():
+    labels = registry("car")
+    labels.use("car")
+    labels.use("car")
+    labels.use("cow")  # not registered yet
+    assert (labels.count("car"), labels.count("cow"), labels.count("dog")) == (2, 1, 0)
+
+
+def test_search_groups():
+    labels = registry("traffic_light", "car", "street_car", "cargo", "scar", "cow")
+    # prefix, then word prefix, then characters in order
+    assert labels.search("car") == ["car", "cargo", "street_car", "scar"]
+    assert labels.search("light") == ["traffic_light"]
+    assert labels.search("tl") == ["traffic_light"]
+    assert labels.search("xyz") == []
+
+
+def test_search_word_separators():
+    labels = registry("road-sign", "road/curb", "road.lane", "road sign")
+    assert labels.search("sign") == ["road-sign", "road sign"]
+    assert labels.search("curb") == ["road/curb"]
+    assert labels.search("lane") == ["road.lane"]
+
+
+def test_search_ignores_case_and_spaces():
+    labels = registry("Person", "personal_item")
+    assert labels.search("  PERS ") == ["Person", "personal_item"]
+    assert labels.search("item") == ["personal_item"]
+
+
+def test_search_ranking():
+    labels = registry("cat", "car", "cart", "cab")
+    assert labels.search("ca") == ["cat", "car", "cart", "cab"]  # registration order
+    labels.use("cart")
+    labels.use("cart")
+    labels.use("car")
+    assert labels.search("ca") == ["car", "cart", "cat", "cab"]  # most recent first
+    labels.use("cart")
+    assert labels.search("ca") == ["cart", "car", "cat", "cab"]
+    assert labels.search("car") == ["cart", "car"]
+
+
+def test_search_ranking_by_count():
+    labels = registry("cat", "car")
+    labels._lastUsed = {}  # same recency, the count decides
+    labels._counts = {"car": 3, "cat": 1}
+    assert labels.search("ca") == ["car", "cat"]
+
+
+def test_ranking_stays_within_groups():
+    labels = registry("car", "scar")
+    labels.use("scar")
+    assert labels.search("car") == ["car", "scar"]
+
+
+def test_empty_query_lists_every_label():
+    labels = registry("car", "dog", "cow")
+    assert labels.search("") == ["car", "dog", "cow"]
+    labels.use("cow")
+    assert labels.search(" ") == ["cow", "car", "dog"]
+
+
+def test_clear():
+    labels = registry("car", "street_car")
+    labels.use("car")
+    labels.clear()
+    assert len(labels) == 0
+    assert labels.search("car") == []
+    assert labels.count("car") == 0
+    assert labels.register("car")
+    assert labels.id("car") == 0
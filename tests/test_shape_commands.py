@@ -0,0 +1,164 @@
+import pytest
+from PyQt6 import QtCore, QtGui
+
+from canvas import Canvas
+from utils.shape_commands import (CreateShapesCommand, DeleteShapesCommand, MoveShapesCommand,
+                                  RelabelShapeCommand)
+
+
+@pytest.fixture
+def canvas(qapp):
+    canvas = Canvas(num_backups=10)
+    canvas.loadPixmap(QtGui.QPixmap(400, 300))
+    return canvas
+
+
+@pytest.fixture
+def store(canvas):
+    # shapes of the open image live in the canvas store
+    return canvas.store
+
+
+@pytest.fixture
+def loaded(canvas, box):
+    shapes = [box(10 * i, 10 * i, 10 * i + 50, 10 * i + 40, f"l{i}") for i in range(4)]
+    canvas.loadShapes(shapes)
+    return shapes
+
+
+def corners(shape):
+    return [(p.x(), p.y()) for p in shape.points]
+
+
+def assertIndexed(canvas):
+    # the hit-test indexes follow canvas.shapes, in the same z-order
+    assert len(canvas.hitTester) == len(canvas.shapes) == len(canvas.shapeIndex)
+    for shape in canvas.shapes:
+        center = shape.boundingRect().center()
+        found = canvas.shapeIndex.query(center)
+        assert shape in found
+        assert [s for s in canvas.shapes[::-1] if s in found] == found
+
+
+def test_push_does_not_apply_the_edit_again(canvas, loaded, box):
+    shape = box(100, 100, 150, 150, "car")
+    canvas.shapes.append(shape)
+    canvas.indexShape(shape)
+    canvas.pushCommand(CreateShapesCommand(canvas, [shape]))
+    assert canvas.shapes == loaded + [shape]
+    assert canvas.undoStack.count() == 1
+    assertIndexed(canvas)
+
+
+def test_create(canvas, loaded, box):
+    shape = box(100, 100, 150, 150)
+    canvas.shapes.append(shape)
+    canvas.indexShape(shape)
+    assert canvas.setLastLabel("car", None) is shape
+    canvas.undoStack.undo()
+    assert canvas.shapes == loaded
+    assertIndexed(canvas)
+    canvas.undoStack.redo()
+    assert canvas.shapes == loaded + [shape]
+    assert shape.label == "car"
+    assertIndexed(canvas)
+
+
+def test_delete_restores_indices(canvas, loaded):
+    canvas.selectedShapes = [loaded[2], loaded[0]]
+    assert canvas.deleteSelected() == [loaded[2], loaded[0]]
+    assert canvas.shapes == [loaded[1], loaded[3]]
+    canvas.undoStack.undo()
+    assert canvas.shapes == loaded
+    assertIndexed(canvas)
+    canvas.undoStack.redo()
+    assert canvas.shapes == [loaded[1], loaded[3]]
+    assertIndexed(canvas)
+
+
+def test_delete_one(canvas, loaded):
+    canvas.deleteShape(loaded[1])
+    assert canvas.shapes == [loaded[0], loaded[2], loaded[3]]
+    canvas.undoStack.undo()
+    assert canvas.shapes == loaded
+    assertIndexed(canvas)
+
+
+def test_move(canvas, loaded):
+    shape = loaded[1]
+    before = shape.points
+    after = [QtCore.QPoint(200, 150), QtCore.QPoint(260, 210)]
+    canvas.setShapesPoints([(shape, after)])
+    canvas.pushCommand(MoveShapesCommand(canvas, [(shape, before, after)]))
+    assert corners(shape) == [(200, 150), (260, 210)]
+    canvas.undoStack.undo()
+    assert corners(shape) == [(10, 10), (60, 50)]
+    assert shape in canvas.shapeIndex.query(QtCore.QPointF(30, 30))
+    assert shape not in canvas.shapeIndex.query(QtCore.QPointF(230, 180))
+    canvas.undoStack.redo()
+    assert corners(shape) == [(200, 150), (260, 210)]
+    assert shape in canvas.shapeIndex.query(QtCore.QPointF(230, 180))
+    assertIndexed(canvas)
+
+
+def test_relabel(canvas, loaded):
+    shape = loaded[0]
+    before = (shape.label, shape.line_color)
+    shape.label = "truck"
+    shape.line_color = QtGui.QColor(255, 0, 0)
+    canvas.relabelShape(shape, before)
+    canvas.undoStack.undo()
+    assert shape.label == "l0"
+    assert shape.line_color == before[1]
+    canvas.undoStack.redo()
+    assert shape.label == "truck"
+    assert shape.line_color == QtGui.QColor(255, 0, 0, 128)
+    assert isinstance(canvas.undoStack.command(0), RelabelShapeCommand)
+
+
+def test_push_after_undo_drops_the_redo(canvas, loaded):
+    canvas.deleteShape(loaded[0])
+    canvas.undoStack.undo()
+    assert canvas.undoStack.canRedo()
+    canvas.deleteShape(loaded[3])
+    assert not canvas.undoStack.canRedo()
+    assert isinstance(canvas.undoStack.command(0), DeleteShapesCommand)
+    assert canvas.undoStack.count() == 1
+    canvas.undoStack.redo()  # nothing to redo
+    assert canvas.shapes == loaded[:3]
+    canvas.undoStack.undo()
+    assert canvas.shapes == loaded
+
+
+def test_undo_and_redo_a_session(canvas, loaded, box):
+    new = box(300, 200, 350, 260)
+    canvas.shapes.append(new)
+    canvas.indexShape(new)
+    canvas.setLastLabel("cow", None)
+    moved = loaded[2]
+    before = moved.points
+    canvas.setShapesPoints([(moved, [QtCore.QPoint(0, 0), QtCore.QPoint(5, 5)])])
+    canvas.pushCommand(MoveShapesCommand(canvas, [(moved, before, moved.points)]))
+    label = (loaded[3].label, loaded[3].line_color)
+    loaded[3].label = "dog"
+    canvas.relabelShape(loaded[3], label)
+    canvas.deleteShape(loaded[1])
+
+    final = ([s.label for s in canvas.shapes], [corners(s) for s in canvas.shapes])
+    assert final[0] == ["l0", "l2", "dog", "cow"]
+    while canvas.undoStack.canUndo():
+        canvas.undoStack.undo()
+    assert canvas.shapes == loaded
+    assert [s.label for s in canvas.shapes] == ["l0", "l1", "l2", "l3"]
+    assert corners(moved) == [(20, 20), (70, 60)]
+    assertIndexed(canvas)
+    while canvas.undoStack.canRedo():
+        canvas.undoStack.redo()
+    assert ([s.label for s in canvas.shapes], [corners(s) for s in canvas.shapes]) == final
+    assertIndexed(canvas)
+
+
+def test_loading_clears_the_stack(canvas, loaded):
+    canvas.deleteShape(loaded[0])
+    canvas.loadShapes(loaded)
+    assert not canvas.undoStack.canUndo()
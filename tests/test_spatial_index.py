@@ -0,0 +1,110 @@
+import numpy as np
+from PyQt6 import QtCore
+
+from Shape import Shape
+from utils.spatial_index import GridIndex
+
+
+def point(x, y):
+    return QtCore.QPointF(x, y)
+
+
+def test_query_cells(box):
+    index = GridIndex(cellSize=100.0)
+    near = box(10, 10, 50, 50)
+    wide = box(0, 0, 450, 20)  # spans five columns
+    far = box(800, 800, 900, 900)
+    for shape in (near, wide, far):
+        index.insert(shape)
+    assert len(index) == 3
+    assert set(index.query(point(20, 20))) == {near, wide}
+    assert index.query(point(420, 10)) == [wide]
+    assert index.query(point(850, 850)) == [far]
+    assert index.query(point(500, 500)) == []
+
+
+def test_query_radius_reaches_neighbour_cells(box):
+    index = GridIndex(cellSize=100.0)
+    shape = box(110, 110, 150, 150)
+    index.insert(shape)
+    assert index.query(point(95, 95)) == []
+    assert index.query(point(95, 95), radius=10) == [shape]
+
+
+def test_topmost_first(box):
+    index = GridIndex()
+    shapes = [box(0, 0, 10, 10) for _ in range(5)]
+    for shape in shapes:
+        index.insert(shape)
+    assert index.query(point(5, 5)) == shapes[::-1]
+    index.update(shapes[0])  # moving keeps the z-order
+    assert index.query(point(5, 5)) == shapes[::-1]
+
+
+def test_update_and_remove(box):
+    index = GridIndex(cellSize=100.0)
+    shape = box(0, 0, 10, 10)
+    index.insert(shape)
+    shape.points = [point(500, 500), point(510, 510)]
+    index.update(shape)
+    assert index.query(point(5, 5)) == []
+    assert index.query(point(505, 505)) == [shape]
+    index.remove(shape)
+    assert shape not in index
+    assert index.query(point(505, 505)) == []
+    assert index._cells == {}
+    index.remove(shape)  # already gone
+    index.update(box(0, 0, 1, 1))  # never indexed
+    assert len(index) == 0
+
+
+def test_negative_and_reversed_coordinates(box):
+    index = GridIndex(cellSize=100.0)
+    shape = box(-50, -150, -250, -10)  # drawn from its bottom right corner
+    index.insert(shape)
+    assert index.query(point(-200, -100)) == [shape]
+    assert index.query(point(-200, 50)) == []
+    assert index.query(point(50, -100)) == []
+
+
+def test_shape_without_points(store):
+    index = GridIndex()
+    shape = Shape(store=store)
+    index.insert(shape)
+    assert shape in index
+    assert index.query(point(0, 0), radius=1000) == []
+
+
+def test_rebuild_with_boxes_matches_inserts(box):
+    rng = np.random.default_rng(0)
+    corners = rng.uniform(-1000, 1000, (200, 4))
+    shapes = [box(*row) for row in corners.tolist()]
+    inserted = GridIndex(cellSize=64.0)
+    for shape in shapes:
+        inserted.insert(shape)
+    rebuilt = GridIndex()
+    rebuilt.rebuild(shapes, cellSize=64.0, boxes=corners)
+    assert rebuilt.cellSize == 64.0
+    for x, y in rng.uniform(-1100, 1100, (100, 2)).tolist():
+        assert rebuilt.query(point(x, y), radius=20) == inserted.query(point(x, y), radius=20)
+
+
+def test_rebuild_nan_rows_get_no_cells(box, store):
+    shapes = [box(0, 0, 10, 10), Shape(store=store), box(5, 5, 20, 20)]
+    boxes = np.array([[0, 0, 10, 10], [np.nan] * 4, [5, 5, 20, 20]], dtype=float)
+    index = GridIndex()
+    index.rebuild(shapes, boxes=boxes)
+    assert len(index) == 3
+    assert index.query(point(6, 6)) == [shapes[2], shapes[0]]
+    index.update(shapes[1])
+    assert index.query(point(6, 6)) == [shapes[2], shapes[0]]
+
+
+def test_rebuild_drops_old_shapes(box):
+    old = box(0, 0, 10, 10)
+    new = box(0, 0, 10, 10)
+    index = GridIndex()
+    index.insert(old)
+    index.rebuild([new])
+    assert old not in index
+    assert index.query(point(5, 5)) == [new]
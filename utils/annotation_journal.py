@@ -0,0 +1,173 @@
+import json
+import os
+import os.path as osp
+
+from PyQt6 import QtCore
+
+JOURNAL_DIR = osp.join(osp.expanduser("~"), ".cache", "label_able", "journal")
+MAX_SLOTS = 64  # journals of instances running at the same time
+
+
+def lockSlot(directory):
+    # a journal slot no running instance holds : (path, lock). a slot is freed when its instance
+    # exits or dies, a free slot whose journal is not empty is taken first so its work is recovered
+    free = None
+    for slot in range(MAX_SLOTS):
+        path = osp.join(directory, f"journal-{slot}.jsonl")
+        leftover = osp.exists(path) and osp.getsize(path) > 0
+        if free is not None and not leftover:
+            continue
+        lock = QtCore.QLockFile(osp.join(directory, f"journal-{slot}.lock"))
+        lock.setStaleLockTime(0)  # only a dead owner makes the lock stale, not a long session
+        if not lock.tryLock(0):
+            continue
+        if leftover:
+            if free is not None:
+                free[1].unlock()
+            return path, lock
+        free = (path, lock)
+    if free is None:
+        raise OSError(f"no free journal slot in {directory}")
+    return free
+
+
+def shapeRow(shape):
+    # [label, x1, y1, x2, y2]
+    row = [shape.label]
+    for p in shape.points:
+        row += [p.x(), p.y()]
+    return row
+
+
+def replay(entries):
+    # (image, save path, rows) of the unsaved work the entries describe, None if there is none
+    state = None
+    for entry in entries:
+        op = entry.get("op")
+        if op == "open":
+            state = (entry["image"], entry.get("save"), [list(row) for row in entry["shapes"]])
+            continue
+        if state is None:
+            continue
+        rows = state[2]
+        if op == "insert":
+            for row in entry["shapes"]:
+                rows.insert(row[0], row[1:])
+        elif op == "remove":
+            for index in sorted(entry["indices"], reverse=True):
+                del rows[index]
+        elif op == "points":
+            for row in entry["shapes"]:
+                rows[row[0]][1:] = row[1:]
+        elif op == "label":
+            rows[entry["index"]][0] = entry["label"]
+    return state
+
+
+class AnnotationJournal(QtCore.QObject):
+    # write-ahead log of the unsaved edits of the open image, one JSON object per line.
+    # the open entry holds the shapes the edits start from and is only written with the
+    # first edit. lines reach the OS as they are written, fsync follows in batches.
+    # saving the labels or opening another image starts the journal over.
+    # every running instance writes its own journal file, see lockSlot
+
+    def __init__(self, directory=JOURNAL_DIR, syncInterval=1000):
+        super().__init__()
+        os.makedirs(directory, exist_ok=True)
+        self.path, self._lock = lockSlot(directory)
+        self.image = None
+        self.savePath = None
+        self._baseline = None  # rows of the open entry not written yet
+        self._file = None
+        self._dirty = osp.exists(self.path) and osp.getsize(self.path) > 0  # something to truncate
+
+        self._sync = QtCore.QTimer(self)
+        self._sync.setSingleShot(True)
+        self._sync.setInterval(syncInterval)
+        self._sync.timeout.connect(self.sync)
+
+    def recover(self):
+        # unsaved work left by the last session, see replay
+        entries = list()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:  # torn last line of a crash
+                        break
+        except OSError:
+            return None
+        try:
+            return replay(entries)
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    def begin(self, image, shapes, savePath=None, dirty=False):
+        # shapes as they are on disk, or unsaved ones when dirty
+        self._truncate()
+        self.image = image
+        self.savePath = savePath
+        self._baseline = [shapeRow(s) for s in shapes]
+        if dirty:
+            self._write(None)
+
+    def insert(self, entries):
+        self._write({"op": "insert", "shapes": [[index] + shapeRow(s) for index, s in entries]})
+
+    def remove(self, indices):
+        self._write({"op": "remove", "indices": list(indices)})
+
+    def setPoints(self, changes):
+        # changes : (index, points)
+        rows = list()
+        for index, points in changes:
+            row = [index]
+            for p in points:
+                row += [p.x(), p.y()]
+            rows.append(row)
+        self._write({"op": "points", "shapes": rows})
+
+    def setLabel(self, index, label):
+        self._write({"op": "label", "index": index, "label": label})
+
+    def _write(self, entry):
+        if self.image is None:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        lines = list()
+        if self._baseline is not None:
+            lines.append({"op": "open", "image": self.image, "save": self.savePath, "shapes": self._baseline})
+            self._baseline = None
+        if entry is not None:
+            lines.append(entry)
+        for line in lines:
+            self._file.write(json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+        self._dirty = True
+        if not self._sync.isActive():
+            self._sync.start()
+
+    def sync(self):
+        self._sync.stop()
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def _truncate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._dirty:
+            with open(self.path, "w", encoding="utf-8") as f:
+                os.fsync(f.fileno())
+            self._dirty = False
+        self.image = None
+        self._baseline = None
+
+    def close(self):
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._lock.unlock()
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import os.path as osp
+import sqlite3
+
+import natsort
+
+from utils.image_probe import ImageInfo
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+LABEL_EXTENSIONS = (".json",)
+INDEX_DIR = osp.join(osp.expanduser("~"), ".cache", "label_able", "index")
+
+
+def indexPath(root, directory=INDEX_DIR):
+    # one index file per dataset folder, named after its absolute path
+    digest = hashlib.sha1(osp.abspath(root).encode("utf-8")).hexdigest()
+    return osp.join(directory, digest + ".sqlite3")
+
+
+class DatasetIndex(object):
+    # Persistent index of a dataset folder, kept as a SQLite file under INDEX_DIR so
+    # read-only datasets are indexed too and the folder itself is never written.
+    # Paths are stored relative to root with a leading separator ("/sub/a.jpg"),
+    # the same form the file list shows, so root + path is the absolute file.
+
+    # the scanner thread and the GUI thread each hold a connection. in WAL mode readers never
+    # wait for the writer, timeout is how long a write waits for the other connection's one
+
+    def __init__(self, root, directory=INDEX_DIR, timeout=5.0):
+        self.root = root.rstrip("/\\") or root
+        self.path = indexPath(self.root, directory)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=timeout, check_same_thread=False)
+            self._createTables()
+        except (OSError, sqlite3.Error):
+            # no writable cache : keep the index for this session only
+            self.path = ":memory:"
+            self.conn = sqlite3.connect(self.path, timeout=timeout, check_same_thread=False)
+            self._createTables()
+
+    def _createTables(self):
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime REAL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                dir TEXT,
+                mtime REAL,
+                size INTEGER,
+                width INTEGER,
+                height INTEGER,
+                has_json INTEGER,
+                depth INTEGER,
+                orientation INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+        """)
+        # index files written before the probe columns existed
+        columns = [r[1] for r in self.conn.execute("PRAGMA table_info(files)")]
+        for column in ("depth", "orientation"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE files ADD COLUMN {column} INTEGER")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def absPath(self, path):
+        return self.root + path
+
+    def scan(self):
+        # generator yielding runs of paths, together the natsort.os_sorted order of the whole
+        # list : the files and subdirectories of a directory are sorted together and a
+        # subdirectory is walked where it sorts. the one difference, a directory's paths stay
+        # together where os_sorted mixes in siblings equal to its name up to an extension or
+        # case, e.g. "/sub.d.jpg" among "/sub/...".
+        # unchanged directories (same mtime) are answered from the index, the others are
+        # listed again with os.scandir.
+        stack = [iter([("", True)])]  # per open directory : its sorted (path, is dir) entries
+        run = list()
+        while stack:
+            entry = next(stack[-1], None)
+            if entry is None:
+                stack.pop()
+                continue
+            path, isDir = entry
+            if not isDir:
+                run.append(path)
+                continue
+            if run:
+                yield run
+                run = list()
+            listing = self._listDir(path)
+            if listing is not None:
+                files, subdirs = listing
+                # a subdirectory sorts as the start of its paths, not as a last component
+                # whose extension is split off
+                entries = [(p, False) for p in files] + [(p, True) for p in subdirs]
+                stack.append(iter(natsort.os_sorted(entries, key=lambda e: e[0] + "/_" if e[1] else e[0])))
+        if run:
+            yield run
+        self.conn.commit()
+
+    def _listDir(self, rel):
+        # (files, subdirs) of a directory, None when it is gone
+        try:
+            mtime = os.stat(self.root + rel).st_mtime
+        except OSError:
+            self._forgetDir(rel)
+            return None
+        row = self.conn.execute("SELECT mtime FROM dirs WHERE path = ?", (rel,)).fetchone()
+        if row is not None and row[0] == mtime:
+            files = [r[0] for r in self.conn.execute("SELECT path FROM files WHERE dir = ?", (rel,))]
+            subdirs = [r[0] for r in self.conn.execute("SELECT path FROM dirs WHERE parent = ?", (rel,))]
+            return files, subdirs
+        files, subdirs = self._rescanDir(rel, mtime)
+        # short transactions, the GUI thread writes image sizes through its own connection
+        self.conn.commit()
+        return files, subdirs
+
+    def refresh(self):
+        paths = list()
+        for files in self.scan():
+            paths.extend(files)
+        return paths
+
+    def _rescanDir(self, rel, mtime):
+        files, subdirs, stats = list(), list(), dict()
+        try:
+            with os.scandir(self.root + rel) as it:
+                for entry in it:
+                    path = rel + "/" + entry.name
+                    try:
+                        if entry.is_dir():
+                            subdirs.append(path)
+                        elif entry.name.lower().endswith(IMAGE_EXTENSIONS + LABEL_EXTENSIONS):
+                            files.append(path)
+                            stats[path] = entry.stat()
+                    except OSError:
+                        continue
+        except OSError:
+            return files, subdirs
+
+        labels = {osp.splitext(p)[0] for p in files if p.lower().endswith(LABEL_EXTENSIONS)}
+        known = {r[0]: r[1:] for r in self.conn.execute(
+            "SELECT path, mtime, size, width, height, depth, orientation FROM files WHERE dir = ?", (rel,))}
+
+        rows = list()
+        for path in files:
+            st = stats[path]
+            info = (None, None, None, None)
+            old = known.get(path)
+            if old is not None and old[0] == st.st_mtime and old[1] == st.st_size:
+                info = old[2:]
+            hasJson = int(osp.splitext(path)[0] in labels)
+            rows.append((path, rel, st.st_mtime, st.st_size, info[0], info[1], hasJson, info[2], info[3]))
+
+        self.conn.execute("DELETE FROM files WHERE dir = ?", (rel,))
+        self.conn.executemany(
+            "INSERT INTO files (path, dir, mtime, size, width, height, has_json, depth, orientation) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+        for path in set(r[0] for r in self.conn.execute("SELECT path FROM dirs WHERE parent = ?", (rel,))) - set(subdirs):
+            self._forgetDir(path)
+        parent = rel.rsplit("/", 1)[0] if rel else None
+        self.conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (rel, parent, mtime))
+        # children are re-stated on the way down, register them so an unchanged parent still finds them
+        self.conn.executemany("INSERT OR IGNORE INTO dirs VALUES (?, ?, NULL)", [(d, rel) for d in subdirs])
+        return files, subdirs
+
+    def _forgetDir(self, rel):
+        stack = [rel]
+        while stack:
+            path = stack.pop()
+            stack.extend(r[0] for r in self.conn.execute("SELECT path FROM dirs WHERE parent = ?", (path,)))
+            self.conn.execute("DELETE FROM files WHERE dir = ?", (path,))
+            self.conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+
+    def fileInfo(self, path):
+        row = self.conn.execute(
+            "SELECT mtime, size, width, height, has_json, depth, orientation FROM files WHERE path = ?",
+            (path,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("mtime", "size", "width", "height", "has_json", "depth", "orientation"), row))
+
+    def imageInfo(self, path):
+        # probed header of an image, None when never probed or the file changed since
+        info = self.fileInfo(path)
+        if info is None or info["width"] is None or info["depth"] is None:
+            return None
+        try:
+            st = os.stat(self.root + path)
+        except OSError:
+            return None
+        if st.st_mtime != info["mtime"] or st.st_size != info["size"]:
+            return None
+        return ImageInfo(info["width"], info["height"], info["depth"], info["orientation"])
+
+    def setImageInfo(self, path, info):
+        self._write("UPDATE files SET width = ?, height = ?, depth = ?, orientation = ? WHERE path = ?",
+                    (info.width, info.height, info.depth, info.orientation, path))
+
+    def setHasJson(self, path, value=True):
+        self._write("UPDATE files SET has_json = ? WHERE path = ?", (int(value), path))
+
+    def _write(self, sql, parameters):
+        # cached values only : skipped while the other connection holds the write lock past timeout
+        try:
+            self.conn.execute(sql, parameters)
+            self.conn.commit()
+        except sqlite3.OperationalError:
+            self.conn.rollback()
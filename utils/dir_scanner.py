@@ -0,0 +1,42 @@
+from PyQt6 import QtCore
+
+from utils.dataset_index import DatasetIndex
+
+
+class DirScanner(QtCore.QThread):
+    # walks a dataset folder off the GUI thread and streams the found paths by batches
+    batchFound = QtCore.pyqtSignal(list)
+    progress = QtCore.pyqtSignal(int)
+
+    BATCH_SIZE = 512
+
+    def __init__(self, root, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.count = 0
+
+    def run(self):
+        index = DatasetIndex(self.root)  # sqlite connection owned by this thread
+        batch = list()
+        try:
+            for files in index.scan():
+                if self.isInterruptionRequested():
+                    break
+                batch.extend(files)
+                # flush the first batch right away so the first image opens as soon as it is found
+                if len(batch) >= self.BATCH_SIZE or self.count == 0:
+                    self._emitBatch(batch)
+                    batch = list()
+            if batch and not self.isInterruptionRequested():
+                self._emitBatch(batch)
+        finally:
+            index.close()
+
+    def _emitBatch(self, batch):
+        self.count += len(batch)
+        self.batchFound.emit(batch)
+        self.progress.emit(self.count)
+
+    def cancel(self):
+        self.requestInterruption()
+        self.wait()
@@ -0,0 +1,177 @@
+import bisect
+import fnmatch
+import re
+from array import array
+from itertools import accumulate
+
+GLOB_CHARS = "*?["
+REGEX_PREFIX = "re:"
+REGEX_META = ".^$*+?{}[]\\|()"
+REGEX_REPEAT = re.compile(r"\{(\d*)(,\d*)?\}")
+# escapes longer than one char : hex, unicode and named chars, backreferences and octal
+REGEX_LONG_ESCAPE = re.compile(r"\\(x[0-9a-fA-F]{0,2}|u[0-9a-fA-F]{0,4}|U[0-9a-fA-F]{0,8}|N\{[^}]*\}?|\d+)")
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def globLiterals(pattern):
+    # literal runs every match must contain, e.g. "img*_0?.jpg" -> ["img", "_0", ".jpg"]
+    literals, run, i = list(), "", 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c in GLOB_CHARS:
+            literals.append(run)
+            run = ""
+            if c == "[":
+                end = pattern.find("]", i + 2)
+                i = len(pattern) if end == -1 else end
+        else:
+            run += c
+        i += 1
+    literals.append(run)
+    return [lit for lit in literals if lit]
+
+
+def regexLiterals(pattern):
+    # conservative literal runs of a regex, nothing for alternations or groups
+    if "|" in pattern or "(" in pattern:
+        return []
+    literals, run, i = list(), "", 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\" and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            run += pattern[i + 1]
+            i += 2
+            continue
+        escape = REGEX_LONG_ESCAPE.match(pattern, i) if c == "\\" else None
+        if escape is not None:
+            literals.append(run)
+            run = ""
+            i = escape.end()
+            continue
+        if c == "{":
+            repeat = REGEX_REPEAT.match(pattern, i)
+            if repeat is None:  # not a quantifier, re takes the brace literally
+                run += c
+                i += 1
+                continue
+            if not repeat.group(1).strip("0") and run:
+                run = run[:-1]  # {0,n} : previous char is optional
+            literals.append(run)
+            run = ""
+            i = repeat.end()
+            continue
+        if c in REGEX_META:
+            if c in "*?" and run:
+                run = run[:-1]  # previous char is optional
+            literals.append(run)
+            run = ""
+            if c == "[":
+                end = pattern.find("]", i + 2)
+                i = len(pattern) if end == -1 else end
+            elif c == "\\":
+                i += 1  # class escape like \d
+        else:
+            run += c
+        i += 1
+    literals.append(run)
+    return [lit for lit in literals if lit]
+
+
+class FileSearchIndex(object):
+    # in-memory trigram index over the scanned paths. a query is a substring,
+    # a glob when it contains one of *?[ , or a regex when prefixed with "re:".
+    # trigram postings narrow the candidates, the full match only runs on those.
+
+    def __init__(self):
+        self.paths = list()
+        self.postings = dict()  # trigram -> array of path ids, ascending
+        self._joined = None
+        self._starts = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def clear(self):
+        self.paths = list()
+        self.postings = dict()
+        self._joined = None
+        self._starts = None
+
+    def add(self, paths):
+        postings = self.postings
+        self._joined = None
+        for path in paths:
+            index = len(self.paths)
+            self.paths.append(path)
+            for gram in trigrams(path):
+                ids = postings.get(gram)
+                if ids is None:
+                    postings[gram] = ids = array("I")
+                ids.append(index)
+
+    def matcher(self, query):
+        # predicate for one path, raises re.error on a bad regex
+        if query.startswith(REGEX_PREFIX):
+            return re.compile(query[len(REGEX_PREFIX):]).search
+        if any(c in query for c in GLOB_CHARS):
+            regex = re.compile(fnmatch.translate(query))
+            return lambda path: regex.match(path) or regex.match(path[path.rfind("/") + 1:])
+        return lambda path: query in path
+
+    def literals(self, query):
+        if query.startswith(REGEX_PREFIX):
+            return regexLiterals(query[len(REGEX_PREFIX):])
+        if any(c in query for c in GLOB_CHARS):
+            return globLiterals(query)
+        return [query]
+
+    def candidates(self, literals):
+        # ascending ids holding every trigram of the literals, None when no literal is long enough
+        grams = set()
+        for literal in literals:
+            grams |= trigrams(literal)
+        if not grams:
+            return None
+        postings = list()
+        for gram in grams:
+            ids = self.postings.get(gram)
+            if ids is None:
+                return []
+            postings.append(ids)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for ids in postings[1:]:
+            if len(result) * 8 < len(ids):
+                break  # verifying the remaining candidates is cheaper than intersecting
+            result.intersection_update(ids)
+        return sorted(result)
+
+    def scan(self, literal):
+        # ids containing a literal too short for trigrams, one str.find pass over all paths joined
+        if self._joined is None:
+            self._joined = "\n".join(self.paths)
+            self._starts = array("I", accumulate((len(path) + 1 for path in self.paths), initial=0))
+        joined, starts = self._joined, self._starts
+        ids = list()
+        pos = joined.find(literal)
+        while pos != -1:
+            index = bisect.bisect_right(starts, pos) - 1
+            ids.append(index)
+            pos = joined.find(literal, starts[index + 1])
+        return ids
+
+    def search(self, query):
+        # ids of the matching paths in scan order
+        if not query:
+            return list(range(len(self.paths)))
+        match = self.matcher(query)
+        ids = self.candidates(self.literals(query))
+        paths = self.paths
+        if ids is None:
+            if self.literals(query) == [query]:
+                return self.scan(query)
+            return [i for i, path in enumerate(paths) if match(path)]
+        return [i for i in ids if match(paths[i])]
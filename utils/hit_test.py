@@ -0,0 +1,167 @@
+import numpy as np
+
+
+class BoxHitTester(object):
+    # rectangle shapes kept as rows x1, y1, x2, y2 of one (N, 4) array, row order being
+    # the z-order. nearest vertex, nearest edge and containment of every box are computed
+    # in one batched pass and match Shape.nearestVertex, nearestEdge and containsPoint.
+    # removed shapes leave a NaN row behind, NaN never hits. the rows are compacted once
+    # the removed ones outnumber the live ones
+
+    def __init__(self, capacity=256):
+        self._boxes = np.full((capacity, 4), np.nan)
+        self._shapes = list()  # row -> shape, None once removed
+        self._rows = dict()  # shape -> row
+        self._removed = 0
+
+    def __contains__(self, shape):
+        return shape in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def boxes(self):
+        return self._boxes[:len(self._shapes)]
+
+    def clear(self):
+        self._boxes[:] = np.nan
+        self._shapes = list()
+        self._rows = dict()
+        self._removed = 0
+
+    def rebuild(self, shapes, boxes=None):
+        # boxes : the rows of shapes when already known, see Shape.boxes
+        shapes = list(shapes)
+        self._boxes = np.full((max(256, len(shapes) * 2), 4), np.nan)
+        self._shapes = list()
+        self._rows = dict()
+        self._removed = 0
+        if boxes is None:
+            for shape in shapes:
+                self.insert(shape)
+            return
+        self._boxes[:len(shapes)] = boxes
+        self._shapes = shapes
+        self._rows = {shape: row for row, shape in enumerate(shapes)}
+
+    def insert(self, shape):
+        row = len(self._shapes)
+        if row == len(self._boxes):
+            grown = np.full((row * 2, 4), np.nan)
+            grown[:row] = self._boxes
+            self._boxes = grown
+        self._shapes.append(shape)
+        self._rows[shape] = row
+        self._place(row, shape)
+
+    def update(self, shape):
+        # shapes not in the tester (drawing preview, move shadows) are ignored
+        row = self._rows.get(shape)
+        if row is not None:
+            self._place(row, shape)
+
+    def remove(self, shape):
+        row = self._rows.pop(shape, None)
+        if row is not None:
+            self._shapes[row] = None
+            self._boxes[row] = np.nan
+            self._removed += 1
+            if self._removed > max(64, len(self._rows)):
+                self._compact()
+
+    def _compact(self):
+        # drop the rows of removed shapes, z-order is kept
+        live = [row for row, shape in enumerate(self._shapes) if shape is not None]
+        boxes = np.full((max(256, len(live) * 2), 4), np.nan)
+        boxes[:len(live)] = self._boxes[live]
+        self._boxes = boxes
+        self._shapes = [self._shapes[row] for row in live]
+        self._rows = {shape: row for row, shape in enumerate(self._shapes)}
+        self._removed = 0
+
+    def _place(self, row, shape):
+        box = self._boxes[row]
+        points = shape.points
+        if not points:
+            box[:] = np.nan
+            return
+        # a single point shape is a box collapsed on that point, which gives the same answers
+        p0, p1 = points[0], points[1] if len(points) > 1 else points[0]
+        box[:] = p0.x(), p0.y(), p1.x(), p1.y()
+
+    def rowsOf(self, shapes):
+        # ascending rows of the shapes in the tester
+        rows = self._rows
+        return np.array(sorted(rows[shape] for shape in shapes if shape in rows), dtype=np.intp)
+
+    def select(self, rows):
+        return self.boxes if rows is None else self._boxes[rows]
+
+    def nearestVertices(self, point, epsilon, rows=None):
+        # per row, or per given row : index of the nearest vertex within epsilon, -1 if none
+        boxes = self.select(rows)
+        x, y = point.x(), point.y()
+        d0 = np.sqrt((boxes[:, 0] - x) ** 2 + (boxes[:, 1] - y) ** 2)
+        d1 = np.sqrt((boxes[:, 2] - x) ** 2 + (boxes[:, 3] - y) ** 2)
+        near0 = d0 <= epsilon
+        near1 = (d1 <= epsilon) & ~(near0 & (d0 <= d1))  # ties go to the first vertex
+        return np.where(near0 & ~near1, 0, np.where(near1, 1, -1))
+
+    def nearestEdges(self, point, epsilon, rows=None):
+        # per row : index of the nearest edge within epsilon, -1 if none. a two point
+        # rectangle has the edges (p1, p0) and (p0, p1), both along its diagonal
+        boxes = self.select(rows)
+        d0 = segmentDistances(point, boxes[:, 2:4], boxes[:, 0:2])
+        d1 = segmentDistances(point, boxes[:, 0:2], boxes[:, 2:4])
+        near0 = d0 <= epsilon
+        near1 = (d1 <= epsilon) & ~(near0 & (d0 <= d1))
+        return np.where(near0 & ~near1, 0, np.where(near1, 1, -1))
+
+    def contains(self, point, rows=None):
+        # QPainterPath.contains of an added rect : left/top edges inside, right/bottom outside
+        boxes = self.select(rows)
+        x, y = point.x(), point.y()
+        left = np.minimum(boxes[:, 0], boxes[:, 2])
+        right = np.maximum(boxes[:, 0], boxes[:, 2])
+        top = np.minimum(boxes[:, 1], boxes[:, 3])
+        bottom = np.maximum(boxes[:, 1], boxes[:, 3])
+        return (left <= x) & (x < right) & (top <= y) & (y < bottom)
+
+    def intersecting(self, rect):
+        # shapes whose box touches rect, in z-order
+        boxes = self.boxes
+        left = np.minimum(boxes[:, 0], boxes[:, 2])
+        right = np.maximum(boxes[:, 0], boxes[:, 2])
+        top = np.minimum(boxes[:, 1], boxes[:, 3])
+        bottom = np.maximum(boxes[:, 1], boxes[:, 3])
+        mask = (right >= rect.left()) & (left <= rect.right()) & (bottom >= rect.top()) & (top <= rect.bottom())
+        shapes = self._shapes
+        return [shapes[row] for row in np.flatnonzero(mask)]
+
+    def hits(self, point, vertexEpsilon, edgeEpsilon, candidates=None):
+        # (shape, vertex index or None, edge index or None) for every shape with a vertex
+        # within vertexEpsilon of point or containing it, topmost first. candidates : the
+        # shapes that can hit, e.g. from GridIndex.query, only their rows are tested
+        rows = None if candidates is None else self.rowsOf(candidates)
+        vertices = self.nearestVertices(point, vertexEpsilon, rows)
+        edges = self.nearestEdges(point, edgeEpsilon, rows)
+        inside = self.contains(point, rows)
+        for i in np.flatnonzero((vertices >= 0) | inside)[::-1]:
+            shape = self._shapes[i if rows is None else rows[i]]
+            vertex, edge = int(vertices[i]), int(edges[i])
+            yield shape, (vertex if vertex >= 0 else None), (edge if edge >= 0 else None)
+
+
+def segmentDistances(point, p1, p2):
+    # Shape.distancetoline of point against every segment p1[i] - p2[i]
+    x, y = point.x(), point.y()
+    dx, dy = p2[:, 0] - p1[:, 0], p2[:, 1] - p1[:, 1]
+    to1 = np.sqrt((x - p1[:, 0]) ** 2 + (y - p1[:, 1]) ** 2)
+    to2 = np.sqrt((x - p2[:, 0]) ** 2 + (y - p2[:, 1]) ** 2)
+    length = np.sqrt(dx * dx + dy * dy)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        line = np.abs(dx * (p1[:, 1] - y) - dy * (p1[:, 0] - x)) / length
+    before = (x - p1[:, 0]) * dx + (y - p1[:, 1]) * dy < 0
+    after = (x - p2[:, 0]) * -dx + (y - p2[:, 1]) * -dy < 0
+    return np.where(before, to1, np.where(after, to2, np.where(length == 0, 0.0, line)))
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+
+from PyQt6 import QtCore, QtGui
+
+
+def decodeImage(filename):
+    # EXIF orientation is applied once on the decoded buffer
+    reader = QtGui.QImageReader(filename)
+    reader.setAutoTransform(True)
+    return reader.read()
+
+
+def decodePreview(filename, size):
+    # reduced resolution decode, JPEG scales in the DCT so it costs a fraction of a full decode.
+    # size is upright, None for formats that would decode at full resolution and scale afterwards anyway
+    reader = QtGui.QImageReader(filename)
+    if not reader.supportsOption(QtGui.QImageIOHandler.ImageOption.ScaledSize):
+        return None
+    reader.setAutoTransform(True)
+    if reader.transformation() & QtGui.QImageIOHandler.Transformation.TransformationRotate90:
+        size = size.transposed()  # the handler scales before the orientation is applied
+    reader.setScaledSize(size)
+    image = reader.read()
+    return None if image.isNull() else image
+
+
+class ImageCacheSignals(QtCore.QObject):
+    imageLoaded = QtCore.pyqtSignal(str)
+
+
+class ImageCache(object):
+    # decoded QImages keyed by filename, least recently used ones are evicted
+    # once the byte budget is exceeded. prefetch decodes on a small thread pool.
+
+    def __init__(self, budget=512 * 1024 * 1024, threads=2):
+        self.budget = budget
+        self.used = 0
+        self.signals = ImageCacheSignals()
+        self.imageLoaded = self.signals.imageLoaded  # emitted from the pool thread
+        self._images = OrderedDict()
+        self._pending = set()
+        self._requested = set()
+        self._lock = threading.Lock()
+        self.pool = QtCore.QThreadPool()
+        self.pool.setMaxThreadCount(threads)
+
+    def __contains__(self, filename):
+        with self._lock:
+            return filename in self._images
+
+    def get(self, filename):
+        with self._lock:
+            image = self._images.get(filename)
+            if image is not None:
+                self._images.move_to_end(filename)
+            return image
+
+    def put(self, filename, image):
+        if image.isNull():
+            return
+        size = image.sizeInBytes()
+        with self._lock:
+            old = self._images.pop(filename, None)
+            if old is not None:
+                self.used -= old.sizeInBytes()
+            self._images[filename] = image
+            self.used += size
+            while self.used > self.budget and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                self.used -= evicted.sizeInBytes()
+
+    def load(self, filename):
+        image = self.get(filename)
+        if image is None:
+            image = decodeImage(filename)
+            self.put(filename, image)
+        return image
+
+    def request(self, filename):
+        # background decode ahead of the prefetches, survives later prefetch calls
+        with self._lock:
+            if filename in self._images or filename in self._requested:
+                return
+            self._requested.add(filename)
+        self.pool.start(lambda: self._decode(filename), 1)
+
+    def prefetch(self, filenames):
+        # drop queued requests for frames the user already moved away from
+        self.pool.clear()
+        with self._lock:
+            self._pending.clear()
+            filenames = [f for f in filenames if f not in self._images]
+            self._pending.update(filenames)
+            requested = list(self._requested)
+        for filename in requested:
+            self.pool.start(lambda f=filename: self._decode(f), 1)
+        for filename in filenames:
+            self.pool.start(lambda f=filename: self._decode(f))
+
+    def _decode(self, filename):
+        with self._lock:
+            if filename not in self._pending and filename not in self._requested:
+                return
+            self._pending.discard(filename)
+            self._requested.discard(filename)
+        self.put(filename, decodeImage(filename))
+        self.imageLoaded.emit(filename)
+
+    def clear(self):
+        self.pool.clear()
+        with self._lock:
+            self._pending.clear()
+            self._requested.clear()
+            self._images.clear()
+            self.used = 0
@@ -0,0 +1,55 @@
+import collections
+import threading
+
+import PIL.Image
+
+mode_to_bpp = {'1': 1, 'L': 8, 'P': 8, 'RGB': 24, 'RGBA': 32, 'CMYK': 32, 'YCbCr': 24, 'I': 32, 'F': 32}
+
+EXIF_ORIENTATION = 0x0112
+
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)  # EXIF orientations that swap width and height
+
+_bombLock = threading.Lock()
+
+
+class ImageInfo(collections.namedtuple("ImageInfo", ["width", "height", "depth", "orientation"])):
+    # width and height are the stored header values, displaySize is the upright size
+    # annotations are drawn on once the EXIF orientation is applied
+    __slots__ = ()
+
+    def displaySize(self):
+        if self.orientation in ROTATED_ORIENTATIONS:
+            return self.height, self.width
+        return self.width, self.height
+
+
+def openHeader(filename):
+    # PIL.Image.open only parses the header : size, mode and EXIF without decoding pixels.
+    # its decompression bomb check would refuse the images drawn from a tile pyramid, it is
+    # lifted for the open only, the GUI and scanner threads both probe
+    with _bombLock:
+        limit = PIL.Image.MAX_IMAGE_PIXELS
+        PIL.Image.MAX_IMAGE_PIXELS = None
+        try:
+            return PIL.Image.open(filename)
+        finally:
+            PIL.Image.MAX_IMAGE_PIXELS = limit
+
+
+def probeImage(filename):
+    with openHeader(filename) as image:
+        width, height = image.size
+        bpp = mode_to_bpp.get(image.mode, 24)
+        if bpp != 1:
+            bpp /= 8
+        try:
+            if image.format == "PNG":
+                # PNG getexif decodes the pixels looking for an eXIf chunk past them
+                exif = PIL.Image.Exif()
+                exif.load(image.info.get("exif", b""))
+            else:
+                exif = image.getexif()
+            orientation = exif.get(EXIF_ORIENTATION, 1)
+        except Exception:  # broken EXIF block, the pixels are still readable
+            orientation = 1
+    return ImageInfo(width, height, int(bpp), orientation)
@@ -0,0 +1,16 @@
+import colorsys
+import hashlib
+
+GOLDEN_RATIO = 0.618033988749895
+
+
+def labelColor(label):
+    # (r, g, b) of a label, the same in every image and session. the hue walks the golden
+    # ratio from a hash of the name, which spreads neighbouring hashes around the wheel.
+    # saturation and value stay in a band that reads on photos and against the white selection
+    digest = hashlib.md5((label or "").encode("utf-8")).digest()
+    hue = (int.from_bytes(digest[:4], "little") * GOLDEN_RATIO) % 1.0
+    saturation = 0.55 + digest[4] / 255 * 0.4
+    value = 0.7 + digest[5] / 255 * 0.3
+    r, g, b = colorsys.hsv_to_rgb(hue, saturation, value)
+    return int(r * 255), int(g * 255), int(b * 255)
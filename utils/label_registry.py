@@ -0,0 +1,94 @@
+import re
+
+from utils.label_trie import LabelTrie
+
+WORD = re.compile(r"[^\s_\-/.]+")
+
+
+def isSubsequence(query, text):
+    chars = iter(text)
+    return all(ch in chars for ch in query)
+
+
+class LabelRegistry(object):
+    # every label name seen this session, hashed : label -> id, color and use count.
+    # backs the unique label dock, the label dialog list and the color of new shapes.
+    # ids follow registration order, which is the order of the unique label dock
+
+    def __init__(self):
+        self.labels = list()  # id -> label
+        self._ids = dict()  # label -> id
+        self._colors = dict()  # label -> QColor
+        self._counts = dict()  # label -> times it was given to a shape
+        self._lastUsed = dict()  # label -> use tick, larger is more recent
+        self._tick = 0
+        self._keys = list()  # id -> lower case label, for fuzzy matching
+        self._names = LabelTrie()  # whole labels
+        self._words = LabelTrie()  # the label from each later word on
+
+    def __contains__(self, label):
+        return label in self._ids
+
+    def __len__(self):
+        return len(self.labels)
+
+    def register(self, label, color=None):
+        # False if the label is known already, its color is kept then
+        if label in self._ids:
+            return False
+        index = self._ids[label] = len(self.labels)
+        self.labels.append(label)
+        self._colors[label] = color
+        key = label.lower()
+        self._keys.append(key)
+        self._names.insert(key, index)
+        for word in list(WORD.finditer(key))[1:]:
+            self._words.insert(key[word.start():], index)
+        return True
+
+    def id(self, label):
+        return self._ids.get(label)
+
+    def color(self, label):
+        return self._colors.get(label)
+
+    def use(self, label):
+        # counted even before the label is registered
+        self._counts[label] = self._counts.get(label, 0) + 1
+        self._tick += 1
+        self._lastUsed[label] = self._tick
+
+    def count(self, label):
+        return self._counts.get(label, 0)
+
+    def search(self, query):
+        # labels matching query, best first : labels starting with it, then labels with a
+        # word starting with it, then labels holding its characters in order. within each
+        # group the most recently used come first, then the most used, then the oldest
+        query = query.strip().lower()
+        if not query:
+            return [self.labels[i] for i in self._rank(range(len(self.labels)))]
+        seen = set()
+        groups = list()
+        for ids in (self._names.prefix(query), self._words.prefix(query)):
+            group = [i for i in ids if i not in seen]
+            seen.update(group)
+            groups.append(group)
+        keys = self._keys
+        groups.append([i for i in range(len(keys)) if i not in seen and isSubsequence(query, keys[i])])
+        labels = self.labels
+        return [labels[i] for group in groups for i in self._rank(set(group))]
+
+    def _rank(self, ids):
+        labels, lastUsed, counts = self.labels, self._lastUsed, self._counts
+        return sorted(ids, key=lambda i: (-lastUsed.get(labels[i], 0), -counts.get(labels[i], 0), i))
+
+    def clear(self):
+        self.labels = list()
+        self._ids = dict()
+        self._colors = dict()
+        self._counts = dict()
+        self._lastUsed = dict()
+        self._keys = list()
+        self._names.clear()
+        self._words.clear()
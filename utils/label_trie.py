@@ -0,0 +1,28 @@
+class LabelTrie(object):
+    # prefix trie over label keys. every node keeps the ids of the labels below it,
+    # so a prefix query costs the length of the prefix plus the number of matches
+
+    def __init__(self):
+        self._root = (dict(), list())  # node : (char -> child node, label ids)
+
+    def insert(self, key, index):
+        node = self._root
+        node[1].append(index)
+        for ch in key:
+            child = node[0].get(ch)
+            if child is None:
+                child = node[0][ch] = (dict(), list())
+            child[1].append(index)
+            node = child
+
+    def prefix(self, key):
+        # ids of the labels inserted under a key starting with key, in insertion order
+        node = self._root
+        for ch in key:
+            node = node[0].get(ch)
+            if node is None:
+                return list()
+        return node[1]
+
+    def clear(self):
+        self._root = (dict(), list())
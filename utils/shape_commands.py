@@ -0,0 +1,83 @@
+from PyQt6 import QtGui
+
+
+class ShapeCommand(QtGui.QUndoCommand):
+    # canvas edits are recorded after they are made, so the first redo pushed by
+    # QUndoStack.push is skipped. each command only keeps the shapes it touched.
+    # subclasses define apply and undo, and record(journal) : the edit as first made
+
+    def __init__(self, canvas, text):
+        super().__init__(text)
+        self.canvas = canvas
+        self._done = True
+
+    def redo(self):
+        if self._done:
+            self._done = False
+            return
+        self.apply()
+
+
+class CreateShapesCommand(ShapeCommand):
+    def __init__(self, canvas, shapes):
+        super().__init__(canvas, "Create Box")
+        self.entries = [(canvas.shapes.index(s), s) for s in shapes]
+
+    def apply(self):
+        self.canvas.insertShapes(self.entries)
+
+    def undo(self):
+        self.canvas.removeShapes([s for _, s in self.entries])
+
+    def record(self, journal):
+        journal.insert(self.entries)
+
+
+class DeleteShapesCommand(ShapeCommand):
+    def __init__(self, canvas, entries):
+        # entries : (index, shape) pairs, index in canvas.shapes before the delete
+        super().__init__(canvas, "Delete Box")
+        self.entries = sorted(entries, key=lambda entry: entry[0])
+
+    def apply(self):
+        self.canvas.removeShapes([s for _, s in self.entries])
+
+    def undo(self):
+        self.canvas.insertShapes(self.entries)
+
+    def record(self, journal):
+        journal.remove([index for index, _ in self.entries])
+
+
+class MoveShapesCommand(ShapeCommand):
+    # move or resize : points of every changed shape before and after
+    def __init__(self, canvas, moves):
+        super().__init__(canvas, "Move Box")
+        self.moves = moves  # (shape, points before, points after)
+
+    def apply(self):
+        self.canvas.setShapesPoints([(s, after) for s, _, after in self.moves])
+
+    def undo(self):
+        self.canvas.setShapesPoints([(s, before) for s, before, _ in self.moves])
+
+    def record(self, journal):
+        journal.setPoints([(self.canvas.shapes.index(s), after) for s, _, after in self.moves])
+
+
+class RelabelShapeCommand(ShapeCommand):
+    def __init__(self, canvas, shape, before, after):
+        # before, after : (label, line color)
+        super().__init__(canvas, "Edit Label")
+        self.shape = shape
+        self.before = before
+        self.after = after
+
+    def apply(self):
+        self.canvas.setShapeLabel(self.shape, *self.after)
+
+    def undo(self):
+        self.canvas.setShapeLabel(self.shape, *self.before)
+
+    def record(self, journal):
+        journal.setLabel(self.canvas.shapes.index(self.shape), self.after[0])
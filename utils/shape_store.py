@@ -0,0 +1,106 @@
+import copy
+
+import numpy as np
+
+# state bits of a row
+CLOSED = 1
+FILL = 2
+SELECTED = 4
+HAS_COLOR = 8  # color column set, otherwise the class default colors are used
+INTEGRAL = 16  # points were QPoints, read back as QPoints
+
+
+class ShapeStore(object):
+    # annotations kept column by column in NumPy arrays, one row per Shape.
+    # labels are interned to ids, label flags and other_data dicts are only stored
+    # for the rows that have them. released rows go to a free list and are reused
+
+    def __init__(self, capacity=1024):
+        self.capacity = 0
+        self.coords = np.zeros((0, 4), dtype=np.float64)  # x1, y1, x2, y2
+        self.npoints = np.zeros(0, dtype=np.int8)
+        self.labelIds = np.zeros(0, dtype=np.int32)  # -1 : no label
+        self.groupIds = np.zeros(0, dtype=np.int32)  # -1 : no group
+        self.colors = np.zeros(0, dtype=np.uint32)  # 0xRRGGBB
+        self.state = np.zeros(0, dtype=np.uint8)
+        self.highlight = np.zeros(0, dtype=np.int8)  # highlighted vertex, -1 : none
+        self.highlightMode = np.zeros(0, dtype=np.int8)
+        self.labels = list()  # label id -> label
+        self._labelIds = dict()  # label -> label id
+        self.flags = dict()  # row -> label flags
+        self.otherData = dict()  # row -> dict
+        self._free = list()
+        self.colorRevision = 0  # bumped by every color change, cached renderings compare it
+        self._used = 0  # rows ever handed out, the rest of the arrays is spare
+        self._grow(capacity)
+
+    def __len__(self):
+        return self._used - len(self._free)
+
+    def _grow(self, capacity):
+        old = self.capacity
+        for name in ("coords", "npoints", "labelIds", "groupIds", "colors", "state", "highlight", "highlightMode"):
+            column = getattr(self, name)
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:old] = column[:old]
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def allocate(self):
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self._used == self.capacity:
+                self._grow(self.capacity * 2)
+            row = self._used
+            self._used += 1
+        self.coords[row] = 0
+        self.npoints[row] = 0
+        self.labelIds[row] = -1
+        self.groupIds[row] = -1
+        self.colors[row] = 0
+        self.state[row] = 0
+        self.highlight[row] = -1
+        self.highlightMode[row] = 0
+        return row
+
+    def release(self, row):
+        self.flags.pop(row, None)
+        self.otherData.pop(row, None)
+        self._free.append(row)
+
+    def copyRow(self, row):
+        new = self.allocate()
+        for column in (self.coords, self.npoints, self.labelIds, self.groupIds,
+                       self.colors, self.state, self.highlight, self.highlightMode):
+            column[new] = column[row]
+        if row in self.flags:
+            self.flags[new] = copy.deepcopy(self.flags[row])
+        if row in self.otherData:
+            self.otherData[new] = copy.deepcopy(self.otherData[row])
+        return new
+
+    def labelId(self, label):
+        if label is None:
+            return -1
+        index = self._labelIds.get(label)
+        if index is None:
+            index = self._labelIds[label] = len(self.labels)
+            self.labels.append(label)
+        return index
+
+    def label(self, row):
+        index = self.labelIds[row]
+        return self.labels[index] if index >= 0 else None
+
+    def hasState(self, row, bit):
+        return bool(self.state[row] & bit)
+
+    def setState(self, row, bit, value):
+        if value:
+            self.state[row] |= bit
+        else:
+            self.state[row] &= ~bit & 0xFF
+
+
+DEFAULT_STORE = ShapeStore()  # shapes made outside a canvas, a canvas keeps one store per image
@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+
+
+class GridIndex(object):
+    # uniform grid over shape bounding rects. every shape remembers the cells it
+    # covers, so a move or a delete only touches those cells. query returns the
+    # shapes near a point topmost first, z-order being the insertion order.
+
+    def __init__(self, cellSize=128.0):
+        self.cellSize = cellSize
+        self._cells = dict()  # (col, row) -> set of shapes
+        self._shapeCells = dict()  # shape -> list of (col, row)
+        self._order = dict()  # shape -> z-order key, larger is drawn on top
+        self._counter = 0
+
+    def __contains__(self, shape):
+        return shape in self._order
+
+    def __len__(self):
+        return len(self._order)
+
+    def clear(self, cellSize=None):
+        if cellSize is not None:
+            self.cellSize = cellSize
+        self._cells = dict()
+        self._shapeCells = dict()
+        self._order = dict()
+        self._counter = 0
+
+    def rebuild(self, shapes, cellSize=None, boxes=None):
+        # boxes : (N, 4) x1, y1, x2, y2 of shapes when already known, NaN rows get no cells
+        self.clear(cellSize)
+        if boxes is None:
+            for shape in shapes:
+                self.insert(shape)
+            return
+        size = self.cellSize
+        placed = ~np.isnan(boxes).any(axis=1)
+        ranges = np.zeros((len(boxes), 4))
+        ranges[placed] = np.floor(np.column_stack((
+            np.minimum(boxes[placed, 0], boxes[placed, 2]), np.minimum(boxes[placed, 1], boxes[placed, 3]),
+            np.maximum(boxes[placed, 0], boxes[placed, 2]), np.maximum(boxes[placed, 1], boxes[placed, 3]))) / size)
+        cellsOf = self._cells
+        for shape, place, (c1, r1, c2, r2) in zip(shapes, placed.tolist(), ranges.astype(int).tolist()):
+            self._order[shape] = self._counter
+            self._counter += 1
+            cells = list()
+            if place:
+                for col in range(c1, c2 + 1):
+                    for row in range(r1, r2 + 1):
+                        cellsOf.setdefault((col, row), set()).add(shape)
+                        cells.append((col, row))
+            self._shapeCells[shape] = cells
+
+    def cellRange(self, x1, y1, x2, y2):
+        size = self.cellSize
+        return (math.floor(x1 / size), math.floor(y1 / size),
+                math.floor(x2 / size), math.floor(y2 / size))
+
+    def insert(self, shape):
+        self._order[shape] = self._counter
+        self._counter += 1
+        self._place(shape)
+
+    def update(self, shape):
+        # shapes not in the index (drawing preview, move shadows) are ignored
+        if shape not in self._order:
+            return
+        self._unplace(shape)
+        self._place(shape)
+
+    def remove(self, shape):
+        if shape not in self._order:
+            return
+        self._unplace(shape)
+        del self._order[shape]
+
+    def _place(self, shape):
+        cells = list()
+        points = shape.points
+        if len(points) > 0:
+            xs = [p.x() for p in points]
+            ys = [p.y() for p in points]
+            c1, r1, c2, r2 = self.cellRange(min(xs), min(ys), max(xs), max(ys))
+            for col in range(c1, c2 + 1):
+                for row in range(r1, r2 + 1):
+                    self._cells.setdefault((col, row), set()).add(shape)
+                    cells.append((col, row))
+        self._shapeCells[shape] = cells
+
+    def _unplace(self, shape):
+        for cell in self._shapeCells.pop(shape, ()):
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(shape)
+                if not bucket:
+                    del self._cells[cell]
+
+    def query(self, point, radius=0.0):
+        # shapes whose bounding rect may lie within radius of point, topmost first
+        x, y = point.x(), point.y()
+        c1, r1, c2, r2 = self.cellRange(x - radius, y - radius, x + radius, y + radius)
+        found = set()
+        for col in range(c1, c2 + 1):
+            for row in range(r1, r2 + 1):
+                bucket = self._cells.get((col, row))
+                if bucket:
+                    found |= bucket
+        order = self._order
+        return sorted(found, key=order.__getitem__, reverse=True)
@@ -0,0 +1,103 @@
+import hashlib
+import multiprocessing
+import os
+import os.path as osp
+import stat
+from concurrent.futures import ProcessPoolExecutor
+
+import PIL.Image
+import PIL.ImageOps
+from PyQt6 import QtCore
+
+THUMBNAIL_SIZE = 256
+CACHE_DIR = osp.join(osp.expanduser("~"), ".cache", "label_able", "thumbnails")
+
+
+def makeThumbnail(filename, target, size):
+    # runs in a worker process, PIL only. draft lets JPEG decode at a reduced DCT scale
+    with PIL.Image.open(filename) as image:
+        image.draft("RGB", (size, size))
+        image = PIL.ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA" if "A" in image.mode else "RGB")
+        # write then rename, readers never see a half written file
+        tmp = f"{target}.{os.getpid()}.tmp"
+        try:
+            image.save(tmp, "PNG")
+            os.replace(tmp, target)
+        except Exception:
+            if osp.exists(tmp):
+                os.remove(tmp)
+            raise
+    return target
+
+
+class ThumbnailCache(QtCore.QObject):
+    # content addressed thumbnails on disk, keyed by path + mtime + size.
+    # missing ones are generated by a process pool, thumbnailReady(source, thumbnail) follows
+    thumbnailReady = QtCore.pyqtSignal(str, str)
+    _finished = QtCore.pyqtSignal(str, object)  # (filename, future) from the executor's thread
+
+    def __init__(self, cacheDir=CACHE_DIR, size=THUMBNAIL_SIZE, workers=None):
+        super().__init__()
+        self.cacheDir = cacheDir
+        self.size = size
+        self.workers = workers
+        self.executor = None  # started on the first request
+        self._pending = set()
+        self._failed = set()  # unreadable files are not retried every time they scroll into view
+        os.makedirs(self.cacheDir, exist_ok=True)
+        self._finished.connect(self._done, QtCore.Qt.ConnectionType.QueuedConnection)
+
+    def target(self, filename):
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        key = f"{osp.abspath(filename)}\0{st.st_mtime_ns}\0{st.st_size}\0{self.size}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return osp.join(self.cacheDir, digest[:2], digest + ".png")
+
+    def path(self, filename):
+        # thumbnail file when already generated, None otherwise
+        target = self.target(filename)
+        if target is not None and osp.exists(target):
+            return target
+        return None
+
+    def request(self, filename):
+        # thumbnail file when cached, otherwise queue its generation and return None
+        target = self.target(filename)
+        if target is None:
+            return None
+        if osp.exists(target):
+            return target
+        if filename in self._pending or filename in self._failed:
+            return None
+        if self.executor is None:
+            # spawned, a fork would copy the locks held by the Qt and prefetch threads
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        os.makedirs(osp.dirname(target), exist_ok=True)
+        self._pending.add(filename)
+        future = self.executor.submit(makeThumbnail, filename, target, self.size)
+        future.add_done_callback(lambda f: self._finished.emit(filename, f))  # handled in the GUI thread
+        return None
+
+    def _done(self, filename, future):
+        self._pending.discard(filename)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self._failed.add(filename)
+            return
+        self.thumbnailReady.emit(filename, future.result())
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)  # only the running thumbnails are waited for
+            self.executor = None
+        self._pending.clear()
@@ -0,0 +1,147 @@
+import math
+import threading
+from collections import OrderedDict
+
+from PyQt6 import QtCore, QtGui
+
+TILE_SIZE = 512
+LOAD_BLOCK = 8  # missing tiles are read in blocks of up to 8 x 8 tiles, 64 MB per read at most
+# larger images are drawn from a tile pyramid. kept well under QImageReader's 256 MB
+# allocation limit, which refuses full decodes of anything around 8192 x 8192 and up
+TILED_IMAGE_PIXELS = 8192 * 4096
+
+_limitLock = threading.Lock()
+
+
+def orientationTransform(orientation, width, height):
+    # stored pixel -> upright pixel for an EXIF orientation, width and height are the stored size
+    return {
+        2: QtGui.QTransform(-1, 0, 0, 1, width, 0),  # mirrored horizontally
+        3: QtGui.QTransform(-1, 0, 0, -1, width, height),  # rotated 180
+        4: QtGui.QTransform(1, 0, 0, -1, 0, height),  # mirrored vertically
+        5: QtGui.QTransform(0, 1, 1, 0, 0, 0),  # transposed
+        6: QtGui.QTransform(0, 1, -1, 0, height, 0),  # rotated 90 clockwise
+        7: QtGui.QTransform(0, -1, -1, 0, height, width),  # transversed
+        8: QtGui.QTransform(0, -1, 1, 0, 0, width),  # rotated 270 clockwise
+    }.get(orientation, QtGui.QTransform())
+
+
+def readsRegions(reader):
+    options = QtGui.QImageIOHandler.ImageOption
+    return reader.supportsOption(options.ClipRect) and reader.supportsOption(options.ScaledSize)
+
+
+def readRegion(reader):
+    # formats that cannot clip or scale while decoding (PNG) read the whole image first, which
+    # the allocation limit refuses for pyramid sized images. the limit is lifted for that read only
+    if readsRegions(reader):
+        return reader.read()
+    with _limitLock:
+        limit = QtGui.QImageReader.allocationLimit()
+        QtGui.QImageReader.setAllocationLimit(0)
+        try:
+            return reader.read()
+        finally:
+            QtGui.QImageReader.setAllocationLimit(limit)
+
+
+class TilePyramid(object):
+    # mip levels of a large image file cut into tiles. level k is the image downscaled by 2**k,
+    # tiles are decoded from the file on demand as region reads, the full resolution image is never
+    # held. least recently drawn tiles are dropped past the byte budget.
+
+    def __init__(self, filename, info, tileSize=TILE_SIZE, budget=256 * 1024 * 1024):
+        self.filename = filename
+        self.width, self.height = info.displaySize()
+        self.tileSize = tileSize
+        self.budget = budget
+        self.used = 0
+        self.maxLevel = max(0, math.ceil(math.log2(max(self.width, self.height) / tileSize)))
+        self._transform = orientationTransform(info.orientation, info.width, info.height)
+        self._inverse = self._transform.inverted()[0]
+        self.readsRegions = readsRegions(QtGui.QImageReader(filename))  # False : every read decodes it all
+        self._tiles = OrderedDict()  # (level, col, row) -> QPixmap
+
+    def levelForScale(self, scale):
+        # finest level still at least as detailed as the screen
+        if scale >= 1.0:
+            return 0
+        return min(self.maxLevel, int(math.floor(math.log2(1.0 / scale))))
+
+    def decode(self, rect, size):
+        # rect of the upright full resolution image decoded at size
+        reader = QtGui.QImageReader(self.filename)
+        reader.setAutoTransform(False)  # the clip rect is in stored coordinates
+        clip = self._inverse.mapRect(QtCore.QRectF(rect)).toAlignedRect()
+        if clip.size() != rect.size():
+            size = size.transposed()
+        if clip != QtCore.QRect(QtCore.QPoint(0, 0), reader.size()):
+            reader.setClipRect(clip)
+        reader.setScaledSize(size)
+        image = readRegion(reader)
+        if self._transform.isIdentity() or image.isNull():
+            return image
+        return image.transformed(self._transform)
+
+    def overview(self, size):
+        # the whole image at size, stands in for the image outside of the canvas. read as the
+        # level drawn at that size, its tiles are kept for the first paint
+        k = self.levelForScale(size.width() / self.width)
+        span = self.tileSize << k
+        image = self.load(k, [(col, row) for row in range((self.height - 1) // span + 1)
+                              for col in range((self.width - 1) // span + 1)])
+        return image.scaled(size, QtCore.Qt.AspectRatioMode.IgnoreAspectRatio,
+                            QtCore.Qt.TransformationMode.SmoothTransformation)
+
+    def load(self, k, tiles):
+        # one region read for the bounding rect of the missing tiles, then cut into tiles
+        ts, span = self.tileSize, self.tileSize << k
+        c0, c1 = min(c for c, _ in tiles), max(c for c, _ in tiles)
+        r0, r1 = min(r for _, r in tiles), max(r for _, r in tiles)
+        left, top = c0 * span, r0 * span
+        rect = QtCore.QRect(left, top, min((c1 + 1) * span, self.width) - left,
+                            min((r1 + 1) * span, self.height) - top)
+        f = 1 << k
+        image = self.decode(rect, QtCore.QSize(-(-rect.width() // f), -(-rect.height() // f)))
+        if image.isNull():
+            return image
+        for col, row in tiles:
+            x, y = (col - c0) * ts, (row - r0) * ts
+            pixmap = QtGui.QPixmap.fromImage(image.copy(x, y, min(ts, image.width() - x), min(ts, image.height() - y)))
+            self._tiles[(k, col, row)] = pixmap
+            self.used += pixmap.width() * pixmap.height() * 4
+        while self.used > self.budget and len(self._tiles) > 1:
+            _, old = self._tiles.popitem(last=False)
+            self.used -= old.width() * old.height() * 4
+        return image
+
+    def paint(self, painter, rect, scale):
+        # rect is the exposed area in full resolution image coordinates
+        k = self.levelForScale(scale)
+        span = self.tileSize << k  # image pixels covered by a tile of level k
+        c0 = max(0, int(rect.left() // span))
+        c1 = min((self.width - 1) // span, int(rect.right() // span))
+        r0 = max(0, int(rect.top() // span))
+        r1 = min((self.height - 1) // span, int(rect.bottom() // span))
+        tiles = [(col, row) for row in range(r0, r1 + 1) for col in range(c0, c1 + 1)]
+        blocks = dict()
+        for col, row in tiles:
+            if (k, col, row) not in self._tiles:
+                # a read that decodes the whole image anyway is done once for all the missing tiles
+                block = (col // LOAD_BLOCK, row // LOAD_BLOCK) if self.readsRegions else None
+                blocks.setdefault(block, []).append((col, row))
+        for missing in blocks.values():
+            self.load(k, missing)
+        device = painter.transform()
+        inverse = device.inverted()[0]
+        for col, row in tiles:
+            key = (k, col, row)
+            pixmap = self._tiles.get(key)
+            if pixmap is None:  # unreadable region
+                continue
+            self._tiles.move_to_end(key)
+            target = QtCore.QRectF(col * span, row * span,
+                                   min(span, self.width - col * span), min(span, self.height - row * span))
+            # snapped out to whole device pixels, neighbouring tiles leave no seam between them
+            target = inverse.mapRect(QtCore.QRectF(device.mapRect(target).toAlignedRect()))
+            painter.drawPixmap(target, pixmap, QtCore.QRectF(pixmap.rect()))
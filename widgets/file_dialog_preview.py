@@ -32,9 +32,13 @@ class ScrollAreaPreview(QtWidgets.QScrollArea):
 
 
 class FileDialogPreview(QtWidgets.QFileDialog):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, thumbnails=None, **kwargs):
         super(FileDialogPreview, self).__init__(*args, **kwargs)
-        self.setOption(self.DontUseNativeDialog, True)
+        self.setOption(QtWidgets.QFileDialog.Option.DontUseNativeDialog, True)
+        self.thumbnails = thumbnails  # ThumbnailCache, previews are never decoded from the full image
+        self.currentPath = None
+        if self.thumbnails is not None:
+            self.thumbnails.thumbnailReady.connect(self.thumbnailReady)
 
         self.labelPreview = ScrollAreaPreview(self)
         self.labelPreview.setFixedSize(300, 300)
@@ -49,6 +53,7 @@ class FileDialogPreview(QtWidgets.QFileDialog):
         self.currentChanged.connect(self.onChange)
 
     def onChange(self, path):
+        self.currentPath = path
         if path.lower().endswith(".json"):
             with open(path, "r") as f:
                 data = json.load(f)
@@ -60,18 +65,30 @@ class FileDialogPreview(QtWidgets.QFileDialog):
             )
             self.labelPreview.setHidden(False)
         else:
-            pixmap = QtGui.QPixmap(path)
-            if pixmap.isNull():
-                self.labelPreview.clear()
-                self.labelPreview.setHidden(True)
-            else:
-                self.labelPreview.setPixmap(
-                    pixmap.scaled(
-                        self.labelPreview.width() - 30,
-                        self.labelPreview.height() - 30,
-                        QtCore.Qt.KeepAspectRatio,
-                        QtCore.Qt.SmoothTransformation,
-                    )
+            thumbnail = self.thumbnails.request(path) if self.thumbnails is not None else None
+            self.showPixmap(QtGui.QPixmap(thumbnail) if thumbnail else QtGui.QPixmap())
+
+    def done(self, result):
+        if self.thumbnails is not None:
+            self.thumbnails.thumbnailReady.disconnect(self.thumbnailReady)
+        super(FileDialogPreview, self).done(result)
+
+    def thumbnailReady(self, path, thumbnail):
+        if path == self.currentPath:
+            self.showPixmap(QtGui.QPixmap(thumbnail))
+
+    def showPixmap(self, pixmap):
+        if pixmap.isNull():
+            self.labelPreview.clear()
+            self.labelPreview.setHidden(True)
+        else:
+            self.labelPreview.setPixmap(
+                pixmap.scaled(
+                    self.labelPreview.width() - 30,
+                    self.labelPreview.height() - 30,
+                    QtCore.Qt.AspectRatioMode.KeepAspectRatio,
+                    QtCore.Qt.TransformationMode.SmoothTransformation,
                 )
-                self.labelPreview.label.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
-                self.labelPreview.setHidden(False)
\ No newline at end of file
+            )
+            self.labelPreview.label.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
+            self.labelPreview.setHidden(False)
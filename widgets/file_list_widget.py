@@ -0,0 +1,110 @@
+from array import array
+
+from PyQt6 import QtCore, QtWidgets
+
+from utils.dataset_index import IMAGE_EXTENSIONS
+
+
+class FileListModel(QtCore.QAbstractListModel):
+    # lazy model over a plain list of paths (shared with the search index).
+    # a filter is an array of path ids, no per-row item object is ever allocated.
+
+    def __init__(self):
+        super().__init__()
+        self._paths = list()
+        self._count = 0  # rows announced when unfiltered, the path list may already hold more
+        self._rows = None  # visible path ids, None shows every path
+        self.root = ""
+        self.thumbnails = None  # ThumbnailCache for the tooltips
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._count if self._rows is None else len(self._rows)
+
+    def data(self, index, role=QtCore.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.ItemDataRole.DisplayRole:
+            return self.path(index.row())
+        if role == QtCore.Qt.ItemDataRole.ToolTipRole:
+            path = self.path(index.row())
+            thumbnail = None
+            if self.thumbnails is not None and path.lower().endswith(IMAGE_EXTENSIONS):
+                thumbnail = self.thumbnails.request(self.root + path)
+            if thumbnail is None:
+                return path
+            return f'<img src="{thumbnail}"><br>{path}'
+        return None
+
+    def path(self, row):
+        if self._rows is not None:
+            row = self._rows[row]
+        return self._paths[row]
+
+    def setSource(self, paths, root=""):
+        self.beginResetModel()
+        self._paths = paths
+        self.root = root
+        self._count = len(paths)
+        self._rows = None
+        self.endResetModel()
+
+    def setRows(self, ids=None):
+        self.beginResetModel()
+        if ids is None:
+            self._count = len(self._paths)
+            self._rows = None
+        else:
+            self._rows = array("I", ids)
+        self.endResetModel()
+
+    def extend(self, ids):
+        # show newly appended paths, ids must be ascending and past the visible ones
+        ids = list(ids)
+        if not ids:
+            return
+        first = self.rowCount()
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(ids) - 1)
+        if self._rows is None:
+            self._count += len(ids)
+        else:
+            self._rows.extend(ids)
+        self.endInsertRows()
+
+
+class FileListWidget(QtWidgets.QListView):
+    itemSelectionChanged = QtCore.pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self.setModel(FileListModel())
+        self.setUniformItemSizes(True)  # no per-row size query, layout stays O(visible rows)
+        self.setLayoutMode(QtWidgets.QListView.LayoutMode.Batched)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.selectionModel().selectionChanged.connect(self.itemSelectionChangedEvent)
+
+    def itemSelectionChangedEvent(self, selected, deselected):
+        self.itemSelectionChanged.emit()
+
+    def count(self):
+        return self.model().rowCount()
+
+    def path(self, row):
+        return self.model().path(row)
+
+    def selectedRows(self):
+        return sorted(index.row() for index in self.selectedIndexes())
+
+    def currentRow(self):
+        rows = self.selectedRows()
+        return rows[0] if rows else -1
+
+    def setCurrentRow(self, row):
+        index = self.model().index(row, 0)
+        self.selectionModel().setCurrentIndex(index, QtCore.QItemSelectionModel.SelectionFlag.ClearAndSelect)
+        self.scrollTo(index)
+
+    def clear(self):
+        self.model().setSource(list())
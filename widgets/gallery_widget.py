@@ -0,0 +1,79 @@
+from collections import OrderedDict
+
+from PyQt6 import QtCore, QtGui, QtWidgets
+
+from utils.dataset_index import IMAGE_EXTENSIONS
+
+
+class GalleryModel(QtCore.QIdentityProxyModel):
+    # file list rows decorated with thumbnails of the shared ThumbnailCache
+    def __init__(self, thumbnails, maxIcons=1024):
+        super().__init__()
+        self.thumbnails = thumbnails
+        self.maxIcons = maxIcons
+        self._icons = OrderedDict()  # source file -> QIcon
+
+        # ready thumbnails arrive one by one, repaint at most every 100 ms
+        self._refresh = QtCore.QTimer(self)
+        self._refresh.setSingleShot(True)
+        self._refresh.setInterval(100)
+        self._refresh.timeout.connect(self.refreshIcons)
+        self.thumbnails.thumbnailReady.connect(self.thumbnailReady)
+
+    def data(self, index, role=QtCore.Qt.ItemDataRole.DisplayRole):
+        if role == QtCore.Qt.ItemDataRole.DecorationRole and index.isValid():
+            source = self.sourceModel()
+            path = source.path(index.row())
+            if not path.lower().endswith(IMAGE_EXTENSIONS):
+                return None
+            return self.icon(source.root + path)
+        return super().data(index, role)
+
+    def icon(self, filename):
+        icon = self._icons.get(filename)
+        if icon is not None:
+            self._icons.move_to_end(filename)
+            return icon
+        thumbnail = self.thumbnails.request(filename)
+        if thumbnail is None:
+            return None
+        icon = QtGui.QIcon(thumbnail)
+        self._icons[filename] = icon
+        if len(self._icons) > self.maxIcons:
+            self._icons.popitem(last=False)
+        return icon
+
+    def thumbnailReady(self, filename, thumbnail):
+        if not self._refresh.isActive():
+            self._refresh.start()
+
+    def refreshIcons(self):
+        rows = self.rowCount()
+        if rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(rows - 1, 0),
+                                  [QtCore.Qt.ItemDataRole.DecorationRole])
+
+
+class GalleryWidget(QtWidgets.QListView):
+    rowSelected = QtCore.pyqtSignal(int)
+
+    def __init__(self, fileListModel, thumbnails):
+        super().__init__()
+        model = GalleryModel(thumbnails)
+        model.setSourceModel(fileListModel)
+        self.setModel(model)
+
+        self.setViewMode(QtWidgets.QListView.ViewMode.IconMode)
+        self.setIconSize(QtCore.QSize(128, 128))
+        self.setGridSize(QtCore.QSize(150, 160))
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QtWidgets.QListView.LayoutMode.Batched)
+        self.setResizeMode(QtWidgets.QListView.ResizeMode.Adjust)
+        self.setMovement(QtWidgets.QListView.Movement.Static)
+        self.setWordWrap(True)
+        self.setTextElideMode(QtCore.Qt.TextElideMode.ElideLeft)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.clicked.connect(self.itemClickedEvent)
+
+    def itemClickedEvent(self, index):
+        self.rowSelected.emit(index.row())
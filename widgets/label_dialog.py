@@ -1,10 +1,13 @@
 from PyQt6 import QtWidgets, QtGui, QtCore
 
 class LabelDialog(QtWidgets.QDialog):
-    def __init__(self, parent=None, uniqLabelList=None):
+    # created once and reused for every shape. the list shows the registered labels
+    # matching what is typed, ranked by LabelRegistry.search, up and down pick from it
+    def __init__(self, parent=None, registry=None):
         super().__init__(parent)
 
         self.setWindowTitle("Set label name")
+        self.registry = registry
 
         QBtn = QtWidgets.QDialogButtonBox.StandardButton.Ok | QtWidgets.QDialogButtonBox.StandardButton.Cancel
 
@@ -15,13 +18,13 @@ class LabelDialog(QtWidgets.QDialog):
         self.layout = QtWidgets.QVBoxLayout()
         self.nameLayout = QtWidgets.QHBoxLayout()
         self.labelList = QtWidgets.QListWidget()
-        label = [label.text() for label in uniqLabelList.allItemList() if uniqLabelList.model().item(0)]
-        if label:
-            self.labelList.addItems(label)
+        self.labelList.setUniformItemSizes(True)
         self.labelList.itemClicked.connect(self.selectLabel)
 
         self.setName = QtWidgets.QLineEdit()
         self.setName.setPlaceholderText("Enter label name")
+        self.setName.textChanged.connect(self.filterLabels)
+        self.setName.installEventFilter(self)
 
         self.nameLayout.addWidget(self.setName)
         self.nameLayout.addWidget(self.buttonbox)
@@ -30,6 +33,37 @@ class LabelDialog(QtWidgets.QDialog):
         self.layout.addWidget(self.labelList)
         self.setLayout(self.layout)
 
+    def popUp(self, text=""):
+        # the label typed or picked, None if cancelled
+        self.setText(text)
+        self.filterLabels(text)
+        self.setName.selectAll()
+        self.setName.setFocus()
+        if self.exec():
+            return self.setName.text()
+        return None
+
+    def setText(self, text):  # without filtering the list again
+        self.setName.blockSignals(True)
+        self.setName.setText(text)
+        self.setName.blockSignals(False)
+
+    def filterLabels(self, text):
+        self.labelList.clear()
+        self.labelList.addItems(self.registry.search(text))
+
+    def eventFilter(self, obj, event):
+        if obj is self.setName and event.type() == QtCore.QEvent.Type.KeyPress and \
+                event.key() in (QtCore.Qt.Key.Key_Up, QtCore.Qt.Key.Key_Down):
+            count = self.labelList.count()
+            if count:
+                step = 1 if event.key() == QtCore.Qt.Key.Key_Down else -1
+                row = min(max(self.labelList.currentRow() + step, 0), count - 1)
+                self.labelList.setCurrentRow(row)
+                self.setText(self.labelList.item(row).text())
+            return True
+        return super().eventFilter(obj, event)
+
     def saveLabel(self):
         if len(self.setName.text()) == 0:
             return
@@ -37,5 +71,5 @@ class LabelDialog(QtWidgets.QDialog):
 
     def selectLabel(self, selected):
         label = selected.text()
-        self.setName.setText(label)
+        self.setText(label)
         self.saveLabel()
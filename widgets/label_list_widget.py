@@ -1,5 +1,7 @@
 from PyQt6 import QtGui, QtCore, QtWidgets
 
+ROWS_MIME = "application/x-label-able-rows"  # internal moves : the dragged row numbers
+
 class LabelListWidgetItem(QtGui.QStandardItem):
     def __init__(self, text=None, shape=None):
         super(LabelListWidgetItem, self).__init__()
@@ -23,6 +25,67 @@ class LabelListWidgetItem(QtGui.QStandardItem):
 class StandardItemModel(QtGui.QStandardItemModel):
     itemDropped = QtCore.pyqtSignal()
 
+    def __init__(self):
+        super().__init__()
+        # shape -> item, kept in step with row inserts, removes, drops and clear
+        self._shapeItems = dict()
+        self.rowsInserted.connect(self._mapRows)
+        self.rowsAboutToBeRemoved.connect(self._unmapRows)
+        self.modelReset.connect(self._shapeItems.clear)
+
+    def mapItem(self, item):
+        shape = item.shape()
+        if shape is not None:
+            self._shapeItems[shape] = item
+
+    def _mapRows(self, parent, first, last):
+        for row in range(first, last + 1):
+            item = self.item(row)
+            if item is not None:  # setItem past the last row inserts the row empty first
+                self.mapItem(item)
+
+    def _unmapRows(self, parent, first, last):
+        for row in range(first, last + 1):
+            item = self.item(row)
+            if item is None:
+                continue
+            shape = item.shape()
+            # a dropped item is cloned into its new row before the old row goes
+            if self._shapeItems.get(shape) is item:
+                del self._shapeItems[shape]
+
+    def itemFromShape(self, shape):
+        return self._shapeItems.get(shape)
+
+    def mimeTypes(self):
+        return [ROWS_MIME]
+
+    def mimeData(self, indexes):
+        # only the row numbers : the default pickles the shape of every dragged item,
+        # and a shape pickles the whole shape store of the image with it
+        rows = sorted({index.row() for index in indexes})
+        data = QtCore.QMimeData()
+        data.setData(ROWS_MIME, QtCore.QByteArray(",".join(map(str, rows)).encode()))
+        return data
+
+    def dropMimeData(self, data, action, row, column, parent):
+        # moves inside the list clone the dragged items, which keeps their shapes
+        if action != QtCore.Qt.DropAction.MoveAction or not data.hasFormat(ROWS_MIME):
+            return False
+        rows = bytes(data.data(ROWS_MIME)).decode()
+        items = [self.item(int(r)) for r in rows.split(",") if r]
+        if not items or any(item is None for item in items):
+            return False
+        if parent.isValid():  # dropped on an item : in front of it, the list stays flat
+            row = parent.row()
+        elif row < 0:
+            row = self.rowCount()
+        for offset, item in enumerate(items):
+            clone = item.clone()
+            clone.setCheckState(item.checkState())
+            self.insertRow(row + offset, clone)
+        return True
+
     def removeRows(self, *args, **kwargs):
         result = super().removeRows(*args, **kwargs)  # bool type
         self.itemDropped.emit()
@@ -54,6 +117,7 @@ class LabelListWidget(QtWidgets.QListView):
         self.setModel(StandardItemModel())
         self.model().setItemPrototype(LabelListWidgetItem())
         self.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.setUniformItemSizes(True)  # one line rows, layout and selection repaints skip per row size hints
         self.setDragDropMode(QtWidgets.QAbstractItemView.DragDropMode.InternalMove)
         self.setDefaultDropAction(QtCore.Qt.DropAction.MoveAction)
         self.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.DoubleClicked)
@@ -90,6 +154,18 @@ class LabelListWidget(QtWidgets.QListView):
         if not isinstance(item, LabelListWidgetItem):
             raise TypeError("item must be LabelListWidgetItem")
         self.model().setItem(self.model().rowCount(), 0, item)
+        self.model().mapItem(item)
+
+    def addItems(self, items):
+        # all rows in one insert
+        if not all(isinstance(item, LabelListWidgetItem) for item in items):
+            raise TypeError("item must be LabelListWidgetItem")
+        self.model().invisibleRootItem().appendRows(items)
+
+    def insertItem(self, row, item):
+        if not isinstance(item, LabelListWidgetItem):
+            raise TypeError("item must be LabelListWidgetItem")
+        self.model().insertRow(min(row, self.model().rowCount()), item)
 
     def removeItem(self, item):
         index = self.model().indexFromItem(item)
@@ -99,6 +175,14 @@ class LabelListWidget(QtWidgets.QListView):
         index = self.model().indexFromItem(item)
         self.selectionModel().select(index, QtCore.QItemSelectionModel.SelectionFlag.Select)
 
+    def selectItems(self, items):
+        # one selection change for all items instead of one per item
+        selection = QtCore.QItemSelection()
+        for item in items:
+            index = self.model().indexFromItem(item)
+            selection.select(index, index)
+        self.selectionModel().select(selection, QtCore.QItemSelectionModel.SelectionFlag.Select)
+
     def allItemList(self):
         itemList = list()
         for index in range(self.model().rowCount()):
@@ -107,11 +191,10 @@ class LabelListWidget(QtWidgets.QListView):
         return itemList
 
     def itemFromShape(self, shape):
-        for row in range(self.model().rowCount()):
-            item = self.model().item(row, 0)
-            if item.shape() == shape:
-                return item
-        raise ValueError(f"cannot find shape : {shape}")
+        item = self.model().itemFromShape(shape)
+        if item is None:
+            raise ValueError(f"cannot find shape : {shape}")
+        return item
 
     def clear(self):
         self.model().clear()
@@ -1,5 +1,7 @@
 from PyQt6 import QtGui, QtCore, QtWidgets
 
+from utils.label_registry import LabelRegistry
+
 class UniqLabelListWidgetItem(QtGui.QStandardItem):
     def __init__(self, text=None, color=None):
         super().__init__()
@@ -34,8 +36,9 @@ class UniqLabelListWidget(QtWidgets.QListView):
     editToNew = 0
     itemClicked = QtCore.pyqtSignal(UniqLabelListWidgetItem)
 
-    def __init__(self):
+    def __init__(self, registry=None):
         super().__init__()
+        self.registry = LabelRegistry() if registry is None else registry  # one row per registered label
 
         self.setWindowFlags(QtCore.Qt.WindowType.Window)
         self.setModel(StandardItemModel())
@@ -53,7 +56,7 @@ class UniqLabelListWidget(QtWidgets.QListView):
         #     self.model().setItem(self.model().rowCount(), 0, item)
         #     return
 
-        if item.text() in [label.text() for label in self.allItemList()]:
+        if not self.registry.register(item.text(), item.color()):
             return
 
         else:
@@ -62,9 +65,9 @@ class UniqLabelListWidget(QtWidgets.QListView):
     def editItem(self, item):
         self.editToExist = 0
         self.editToNew = 0
-        if item.text() in [label.text() for label in self.allItemList()]:
+        if item.text() in self.registry:
             self.editToExist = 1
-            self.existColor = [uniq.color() for uniq in self.allItemList() if item.text() == uniq.text()][0]
+            self.existColor = self.registry.color(item.text())
 
         else:
             self.editToNew = 1
@@ -77,4 +80,5 @@ class UniqLabelListWidget(QtWidgets.QListView):
         return itemList
 
     def clear(self):
-        self.model().clear()
\ No newline at end of file
+        self.model().clear()
+        self.registry.clear()
\ No newline at end of file